@@ -0,0 +1,44 @@
+""" Measure start-up cost of `import autochord` with lazy vs. eager initialization """
+import argparse
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+
+_SNIPPETS = {
+    # what `import autochord` used to do before lazy initialization
+    'eager (import + init)': 'import autochord; autochord.init()',
+    'lazy (import only)': 'import autochord',
+    'lazy (import + label constants)': 'import autochord; autochord._MAJMIN_CLASSES',
+}
+
+
+def time_snippet(snippet, runs):
+    """ Wall time (s) of running `snippet` in fresh interpreters """
+    durs = []
+    for _ in range(runs):
+        st = time.perf_counter()
+        subprocess.run([sys.executable, '-c', snippet], check=True,
+                       stdout=subprocess.DEVNULL)
+        durs.append(time.perf_counter() - st)
+
+    return np.array(durs)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--runs', type=int, default=5)
+    args = parser.parse_args()
+
+    baseline = time_snippet('pass', args.runs)
+    print(f'interpreter start-up: {np.median(baseline):.3f} s (median of {args.runs})')
+    for name, snippet in _SNIPPETS.items():
+        durs = time_snippet(snippet, args.runs) - np.median(baseline)
+        print(f'{name:35s} median {np.median(durs):.3f} s, '
+              f'min {durs.min():.3f} s, max {durs.max():.3f} s')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+"""
+Latency of Keras model inference on short vs. long inputs: the traced
+fixed-shape function used by `predict_chord_labels` ('compiled') against
+`Model.predict` on every call ('predict'), plus concurrent calls from
+several threads checked against single-threaded labels
+"""
+import argparse
+import threading
+import time
+
+import numpy as np
+
+import autochord
+
+
+_DURATIONS = [5, 30, 180, 600] # seconds
+
+
+def predict_keras(chroma):
+    """ Previous inference path: `Model.predict` on every call """
+    chordseq_vectors = autochord._to_subsequences(chroma)
+    pred_labels, _, _, _ = autochord._get_model().predict(chordseq_vectors,
+                                                          batch_size=autochord._BATCH_SIZE)
+    return autochord._from_subsequences(pred_labels, len(chroma))
+
+def predict_compiled(chroma):
+    return autochord.predict_chord_labels(chroma, backend='keras')
+
+
+def latencies(predict, chroma, runs):
+    durs = []
+    for _ in range(runs):
+        st = time.perf_counter()
+        predict(chroma)
+        durs.append(time.perf_counter() - st)
+    return np.array(durs)
+
+
+def concurrent_check(inputs, num_threads, runs):
+    """ Run compiled inference on all inputs from `num_threads` threads; (wall time, all equal) """
+    expected = [predict_compiled(chroma) for chroma in inputs]
+    mismatches = []
+
+    def worker():
+        for _ in range(runs):
+            for chroma, labels in zip(inputs, expected):
+                if not np.array_equal(predict_compiled(chroma), labels):
+                    mismatches.append(len(chroma))
+
+    threads = [threading.Thread(target=worker) for _ in range(num_threads)]
+    st = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return time.perf_counter() - st, not mismatches
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--durations', type=float, nargs='+', default=_DURATIONS)
+    parser.add_argument('--runs', type=int, default=20)
+    parser.add_argument('--threads', type=int, default=8)
+    args = parser.parse_args()
+
+    autochord.warmup(backend='keras')
+    predict_keras(np.zeros((autochord._SEQ_LEN, autochord._CHROMA_NUM_FEATS), dtype=np.float32))
+
+    rng = np.random.default_rng(0)
+    inputs = [rng.random((int(np.ceil(duration/autochord._STEP_SIZE)), autochord._CHROMA_NUM_FEATS),
+                         dtype=np.float32) for duration in args.durations]
+
+    print(f'{"dur(s)":>7s} {"frames":>7s} {"path":>9s} {"p50(ms)":>8s} {"p99(ms)":>8s} {"speedup":>8s}')
+    for duration, chroma in zip(args.durations, inputs):
+        ref_p50 = None
+        for name, predict in [('predict', predict_keras), ('compiled', predict_compiled)]:
+            durs = latencies(predict, chroma, args.runs)*1000
+            p50, p99 = np.percentile(durs, 50), np.percentile(durs, 99)
+            ref_p50 = ref_p50 or p50
+            print(f'{duration:7.0f} {len(chroma):7d} {name:>9s} {p50:8.1f} {p99:8.1f} '
+                  f'{ref_p50/p50:7.1f}x')
+
+    wall, consistent = concurrent_check(inputs, args.threads, max(1, args.runs//4))
+    print(f'{args.threads} threads: {wall:.2f} s, labels '
+          + ('identical to single-threaded' if consistent else 'DIFFER from single-threaded'))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+"""
+Compare chroma of the 'numpy' NNLS chroma extractor (`autochord.nnls_chroma`)
+against the NNLS-Chroma VAMP plugin, and the speed (frames/s) of both.
+
+Parity is reported per output half (bass, treble): per-frame cosine similarity
+(mean and 5th percentile), relative error (max. absolute difference over max.
+plugin value), frames whose strongest bin agrees, and with `--labels` the
+agreement of recognized chords.
+"""
+import argparse
+import time
+
+import numpy as np
+
+import autochord
+from autochord.nnls_chroma import nnls_chroma
+from resample_bench import synth_chords
+
+
+_DURATIONS = [30, 180, 600] # seconds
+_HALVES = {'bass': slice(0, 12), 'treble': slice(12, 24)}
+
+
+def time_extractor(extract, samples, runs):
+    durs = []
+    for _ in range(runs):
+        st = time.perf_counter()
+        chroma = extract(samples)
+        durs.append(time.perf_counter() - st)
+    return min(durs), chroma
+
+
+def parity(chroma, ref_chroma):
+    """ {half: (mean cosine, 5th pct. cosine, relative error, argmax agreement)} """
+    out = {}
+    for half, bins in _HALVES.items():
+        a, b = chroma[:, bins].astype(np.float64), ref_chroma[:, bins].astype(np.float64)
+        norms = np.linalg.norm(a, axis=1)*np.linalg.norm(b, axis=1)
+        voiced = norms > 0 # cosine is undefined on silent frames
+        cosine = np.sum(a*b, axis=1)[voiced]/norms[voiced]
+        rel_err = np.abs(a - b).max(initial=0)/max(b.max(initial=0), np.finfo(np.float32).tiny)
+        argmax_agree = np.mean(a[voiced].argmax(axis=1) == b[voiced].argmax(axis=1))
+        out[half] = (cosine.mean(), np.percentile(cosine, 5), rel_err, argmax_agree)
+    return out
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('audio_files', nargs='*',
+                        help='audio files to compare on (default: synthetic chords)')
+    parser.add_argument('--durations', type=float, nargs='+', default=_DURATIONS,
+                        help='durations of synthetic audio, if no files given')
+    parser.add_argument('--rollon', type=float, default=1.0)
+    parser.add_argument('--runs', type=int, default=3)
+    parser.add_argument('--labels', action='store_true',
+                        help='also compare recognized chords (needs the model)')
+    args = parser.parse_args()
+
+    if args.audio_files:
+        import librosa
+        inputs = [(fn, autochord.resample(*librosa.load(fn, sr=None, mono=True)))
+                  for fn in args.audio_files]
+    else:
+        inputs = [(f'synth {duration:g} s', synth_chords(autochord._SAMPLE_RATE, duration)[0])
+                  for duration in args.durations]
+
+    extractors = {
+        'vamp': lambda samples: autochord._nnls_chroma(samples, args.rollon),
+        'numpy': lambda samples: nnls_chroma(samples, args.rollon),
+    }
+    autochord._ensure_chroma_vamp()
+    nnls_chroma(np.zeros(autochord._CHROMA_BLOCK, dtype=np.float32)) # precompute kernels
+
+    for name, samples in inputs:
+        print(f'--- {name}')
+        chroma = {}
+        for extractor, extract in extractors.items():
+            dur, chroma[extractor] = time_extractor(extract, samples, args.runs)
+            print(f'{extractor:>6s}: {dur:8.3f} s, {len(chroma[extractor])/dur:8.0f} frames/s')
+
+        if len(chroma['numpy']) != len(chroma['vamp']):
+            print(f'frame count mismatch: {len(chroma["numpy"])} vs. {len(chroma["vamp"])}')
+            continue
+
+        for half, (cos_mean, cos_p5, rel_err, argmax_agree) in parity(chroma['numpy'],
+                                                                      chroma['vamp']).items():
+            print(f'{half:>6s}: cosine mean {cos_mean:.4f} p5 {cos_p5:.4f}, '
+                  f'rel. error {rel_err:.4f}, argmax agreement {argmax_agree:.2%}')
+
+        if args.labels:
+            labels = {extractor: autochord.predict_chord_labels(c) for extractor, c in chroma.items()}
+            print(f'label agreement: {np.mean(labels["numpy"] == labels["vamp"]):.2%}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,45 @@
+""" Compare labels and speed of the 'numpy' inference backend against the 'keras' one """
+import argparse
+import time
+
+import numpy as np
+
+import autochord
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('chroma_files', nargs='*',
+                        help='.npy chroma matrices (default: random chroma)')
+    parser.add_argument('--num-frames', type=int, default=5000,
+                        help='length of random chroma, if no files given')
+    args = parser.parse_args()
+
+    if args.chroma_files:
+        inputs = [np.load(fn) for fn in args.chroma_files]
+    else:
+        rng = np.random.default_rng(0)
+        inputs = [rng.random((args.num_frames, autochord._CHROMA_NUM_FEATS), dtype=np.float32)]
+
+    for backend in autochord._BACKENDS:
+        autochord.warmup(backend=backend)
+
+    num_same, num_total = 0, 0
+    durs = {backend: 0.0 for backend in autochord._BACKENDS}
+    for chroma in inputs:
+        labels = {}
+        for backend in autochord._BACKENDS:
+            st = time.perf_counter()
+            labels[backend] = autochord.predict_chord_labels(chroma, backend=backend)
+            durs[backend] += time.perf_counter() - st
+
+        num_same += np.sum(labels['keras'] == labels['numpy'])
+        num_total += len(chroma)
+
+    print(f'label agreement: {num_same}/{num_total} frames ({num_same/num_total:.4%})')
+    for backend, dur in durs.items():
+        print(f'{backend:6s}: {dur:.3f} s, {num_total/dur:.0f} frames/s')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,113 @@
+"""
+Benchmark each stage of `autochord.recognize` (decode, resample, chroma,
+predict, postprocess) on synthetic audio of several durations and sample
+rates, writing machine-readable results (JSON) to compare across versions:
+
+    python pipeline_stages.py --out results-new.json --compare results-old.json
+"""
+import argparse
+import json
+import os
+import platform
+import tempfile
+import time
+
+import numpy as np
+import soundfile as sf
+
+import autochord
+from resample_bench import synth_chords
+
+
+_RATES = [22050, 44100, 48000]
+_DURATIONS = [30, 180, 600] # seconds
+
+
+def package_version():
+    try:
+        from importlib.metadata import version
+        return version('autochord')
+    except Exception:
+        return 'unknown'
+
+def environment():
+    return {'autochord': package_version(), 'numpy': np.__version__,
+            'python': platform.python_version(), 'platform': platform.platform(),
+            'processor': platform.processor(), 'cpu_count': os.cpu_count(),
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S%z')}
+
+
+def run_case(audio_fn, backend, runs, track_memory):
+    """ Per-stage summary of the fastest (total wall time) of `runs` runs """
+    best = None
+    for _ in range(runs):
+        stats = autochord.PipelineStats(track_memory=track_memory)
+        autochord.recognize(audio_fn, lab_fn=f'{audio_fn}.lab', backend=backend, stats=stats)
+        summary = stats.summary()
+        total = sum(stage['wall'] for stage in summary.values())
+        if (best is None) or (total < best[0]):
+            best = (total, summary)
+    return best[1]
+
+
+def compare(results, ref_results):
+    """ Print wall time ratio (new/ref) of each stage of cases found in both """
+    ref_cases = {(r['rate'], r['duration'], r['backend']): r['stages'] for r in ref_results['results']}
+    print(f'\nvs. {ref_results["environment"]["autochord"]} ({ref_results["environment"]["time"]}): '
+          'wall time ratio new/ref, > 1 is slower')
+    for result in results['results']:
+        ref_stages = ref_cases.get((result['rate'], result['duration'], result['backend']))
+        if ref_stages is None:
+            continue
+        ratios = [f'{name}={stage["wall"]/ref_stages[name]["wall"]:.2f}'
+                  for name, stage in result['stages'].items()
+                  if (name in ref_stages) and ref_stages[name]['wall'] > 0]
+        print(f'{result["rate"]:6d} Hz {result["duration"]:5.0f} s {result["backend"]:>6s}: '
+              + ' '.join(ratios))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rates', type=int, nargs='+', default=_RATES)
+    parser.add_argument('--durations', type=float, nargs='+', default=_DURATIONS)
+    parser.add_argument('--backends', nargs='+', default=['keras'], choices=autochord._BACKENDS)
+    parser.add_argument('--runs', type=int, default=3)
+    parser.add_argument('--track-memory', action='store_true',
+                        help='per-stage peak memory via tracemalloc (slower)')
+    parser.add_argument('--out', default='pipeline_stages.json')
+    parser.add_argument('--compare', help='results JSON of a previous version')
+    args = parser.parse_args()
+
+    for backend in args.backends: # keep start-up costs out of the stages
+        autochord.warmup(backend=backend)
+
+    results = {'environment': environment(), 'runs': args.runs, 'results': []}
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for fs in args.rates:
+            for duration in args.durations:
+                audio_fn = os.path.join(tmp_dir, f'synth_{fs}_{duration:g}.wav')
+                sf.write(audio_fn, synth_chords(fs, duration)[0], fs)
+                for backend in args.backends:
+                    stages = run_case(audio_fn, backend, args.runs, args.track_memory)
+                    results['results'].append({'rate': fs, 'duration': duration,
+                                               'backend': backend, 'stages': stages})
+                    print(f'--- {fs} Hz, {duration:g} s, {backend}')
+                    for name in autochord.profiling._STAGES:
+                        stage = stages.get(name)
+                        if stage:
+                            print(f'{name:>12s} {stage["wall"]:8.3f} s wall {stage["cpu"]:8.3f} s cpu '
+                                  f'{stage["fps"] or 0:10.0f} frames/s')
+
+    results['max_rss'] = autochord.PipelineStats.max_rss()
+    with open(args.out, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f'Results written to {args.out}')
+
+    if args.compare:
+        with open(args.compare) as f:
+            compare(results, json.load(f))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,95 @@
+"""
+Benchmark resampling to the operating sample rate over a set of input rates
+and durations, and (optionally) the effect of each method on recognized chords
+"""
+import argparse
+import time
+
+import numpy as np
+
+import autochord
+from autochord.resampling import resample, _QUALITIES
+
+
+_RATES = [8000, 16000, 22050, 32000, 48000, 88200, 96000]
+_DURATIONS = [30, 180, 600] # seconds
+_CHORD_DURATION = 2.0       # seconds per chord in synthetic audio
+
+
+def synth_chords(fs, duration, seed=0):
+    """
+    Synthetic audio of random major/minor triads (harmonic tones), and
+    the index in `_MAJMIN_CLASSES` of the chord at each chroma frame
+    """
+    rng = np.random.default_rng(seed)
+    num_chords = int(np.ceil(duration/_CHORD_DURATION))
+    chord_len = int(_CHORD_DURATION*fs)
+    classes = rng.integers(1, len(autochord._MAJMIN_CLASSES), size=num_chords)
+
+    t = np.arange(chord_len)/fs
+    envelope = np.minimum(1.0, np.minimum(t, t[::-1])/0.01) # avoid clicks
+    samples = []
+    for chord_class in classes:
+        root = (chord_class-1) % 12
+        third = 3 if chord_class > 12 else 4
+        chord = np.zeros(chord_len)
+        for semitone in [root, root+third, root+7]:
+            f0 = 130.81*2**(semitone/12) # from C3
+            for harmonic in range(1, 6):
+                if f0*harmonic < fs/2:
+                    chord += np.sin(2*np.pi*f0*harmonic*t)/harmonic
+        samples.append(0.1*envelope*chord)
+
+    samples = np.concatenate(samples)[:int(duration*fs)].astype(np.float32)
+    frame_times = np.arange(int(np.ceil(len(samples)*autochord._SAMPLE_RATE/fs
+                                        / autochord._CHROMA_HOP)))*autochord._STEP_SIZE
+    frame_labels = classes[np.minimum((frame_times/_CHORD_DURATION).astype(int), num_chords-1)]
+    return samples, frame_labels
+
+
+def time_resample(samples, fs, quality, runs):
+    durs = []
+    for _ in range(runs):
+        st = time.perf_counter()
+        out = resample(samples, fs, quality=quality)
+        durs.append(time.perf_counter() - st)
+    return min(durs), out
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rates', type=int, nargs='+', default=_RATES)
+    parser.add_argument('--durations', type=float, nargs='+', default=_DURATIONS)
+    parser.add_argument('--runs', type=int, default=3)
+    parser.add_argument('--accuracy', action='store_true',
+                        help='also compare recognized chords (needs VAMP plugin and model)')
+    args = parser.parse_args()
+
+    print(f'{"rate":>6s} {"dur(s)":>7s} {"quality":>8s} {"time(s)":>8s} {"speedup":>8s}'
+          + (f' {"agree":>6s} {"acc":>6s}' if args.accuracy else ''))
+    for fs in args.rates:
+        for duration in args.durations:
+            # odd length, as FFT cost depends heavily on the factors of the length
+            samples, frame_labels = synth_chords(fs, duration)
+            samples = samples[:len(samples) - (1 - len(samples) % 2)]
+
+            ref_time, ref_labels = None, None
+            for quality in ['fft'] + [q for q in _QUALITIES if q != 'fft']:
+                dur, out = time_resample(samples, fs, quality, args.runs)
+                ref_time = ref_time or dur
+                line = f'{fs:6d} {duration:7.0f} {quality:>8s} {dur:8.3f} {ref_time/dur:7.1f}x'
+
+                if args.accuracy:
+                    labels = autochord.predict_chord_labels(autochord._nnls_chroma(out))
+                    if ref_labels is None:
+                        ref_labels = labels
+                    num = min(len(labels), len(ref_labels), len(frame_labels))
+                    agree = np.mean(labels[:num] == ref_labels[:num])
+                    acc = np.mean(labels[:num] == frame_labels[:num])
+                    line += f' {agree:6.3f} {acc:6.3f}'
+
+                print(line)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+"""
+Load test for the autochord inference server: concurrent clients post random
+chroma to /predict, and throughput plus p50/p99 latency are reported.
+
+Start a server first (python -m autochord.server), or pass --spawn to run one
+in-process.
+"""
+import argparse
+import threading
+import time
+
+import numpy as np
+
+from autochord import _CHROMA_NUM_FEATS
+from autochord.server import predict_remote, serve
+
+
+def client(url, num_requests, frame_range, seed, latencies, errors):
+    rng = np.random.default_rng(seed)
+    for _ in range(num_requests):
+        chroma = rng.random((rng.integers(*frame_range), _CHROMA_NUM_FEATS), dtype=np.float32)
+        st = time.perf_counter()
+        try:
+            predict_remote(chroma, url=url)
+        except Exception as e:
+            errors.append(e)
+            continue
+        latencies.append((time.perf_counter() - st, len(chroma)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', default='http://127.0.0.1:8765')
+    parser.add_argument('--clients', type=int, default=16)
+    parser.add_argument('--requests', type=int, default=20, help='requests per client')
+    parser.add_argument('--min-frames', type=int, default=200)
+    parser.add_argument('--max-frames', type=int, default=6000) # ~4.5 min. of audio
+    parser.add_argument('--spawn', action='store_true', help='start a server in-process')
+    parser.add_argument('--backend', default='keras', help='backend of spawned server')
+    parser.add_argument('--max-latency-ms', type=float, default=5.0,
+                        help='batching window of spawned server')
+    args = parser.parse_args()
+
+    if args.spawn:
+        port = int(args.url.rsplit(':', 1)[-1])
+        threading.Thread(target=serve, daemon=True,
+                         kwargs={'port': port, 'backend': args.backend,
+                                 'max_latency': args.max_latency_ms/1000}).start()
+        for _ in range(600): # wait for model to load
+            try:
+                predict_remote(np.zeros((1, _CHROMA_NUM_FEATS)), url=args.url)
+                break
+            except OSError:
+                time.sleep(0.5)
+
+    latencies, errors = [], []
+    threads = [threading.Thread(target=client,
+                                args=(args.url, args.requests, (args.min_frames, args.max_frames),
+                                      seed, latencies, errors))
+               for seed in range(args.clients)]
+
+    st = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    dur = time.perf_counter() - st
+
+    lat = np.array([l for l, _ in latencies])
+    num_frames = sum(n for _, n in latencies)
+    print(f'{len(latencies)} requests ({len(errors)} errors) in {dur:.2f} s')
+    print(f'throughput: {len(latencies)/dur:.1f} req/s, {num_frames/dur:.0f} frames/s')
+    if len(lat) > 0:
+        print(f'latency: p50 {np.percentile(lat, 50)*1000:.1f} ms, '
+              f'p99 {np.percentile(lat, 99)*1000:.1f} ms, max {lat.max()*1000:.1f} ms')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,77 @@
+"""
+Pitch-shift (transposition) augmentation done on chroma and chord labels
+directly, instead of re-extracting chroma from pitch-shifted audio
+
+Transposing by `shift` semitones rolls each 12-bin half (bass, treble) of the
+bothchroma vector (`dataloader._CHROMA_FEAT_NAMES`) by `shift`, and maps a
+chord class `1 + block*12 + root` (see `dataloader.encode_chords_single_label`)
+to `1 + block*12 + (root+shift)%12`; `N` is unchanged. Both are gathers with
+tables per shift, applied to whole batches.
+"""
+import numpy as np
+
+import dataloader
+from dataloader import _NUM_SEMITONE, _NO_CHORD_INDEX
+
+
+_NUM_CHROMA_HALVES = 2 # bass, treble
+_LABEL_NUM_CLASSES = {'majmin': len(dataloader._MAJMIN_CLASSES),
+                      'majmin7': len(dataloader._MAJMIN7_CLASSES)}
+
+
+def chroma_shift_perms():
+    """ (12, 24) feature indices: transposed[..., j] = chroma[..., perms[shift, j]] """
+    shifts = np.arange(_NUM_SEMITONE)[:, np.newaxis]
+    bins = np.arange(_NUM_SEMITONE)[np.newaxis, :]
+    half_perm = (bins - shifts) % _NUM_SEMITONE
+    return np.concatenate([half_perm + half*_NUM_SEMITONE
+                           for half in range(_NUM_CHROMA_HALVES)], axis=1)
+
+def label_shift_maps(num_classes):
+    """ (12, num_classes) class maps: transposed label = maps[shift, label] """
+    classes = np.arange(num_classes)[np.newaxis, :]
+    shifts = np.arange(_NUM_SEMITONE)[:, np.newaxis]
+    block, root = (classes-1)//_NUM_SEMITONE, (classes-1)%_NUM_SEMITONE
+    maps = 1 + block*_NUM_SEMITONE + (root+shifts)%_NUM_SEMITONE
+    maps[:, classes[0] == _NO_CHORD_INDEX] = _NO_CHORD_INDEX
+    return maps
+
+
+def transpose(feats, labels, shifts, num_classes=_LABEL_NUM_CLASSES['majmin']):
+    """
+    Transpose batch of sequences by `shifts` semitones (one per sequence).
+    feats: (batch, time, 24), labels: (batch, time), shifts: (batch,)
+    """
+    shifts = np.asarray(shifts) % _NUM_SEMITONE
+    perms = chroma_shift_perms()[shifts]
+    feats = np.take_along_axis(feats, perms[:, np.newaxis, :], axis=-1)
+    labels = label_shift_maps(num_classes)[shifts[:, np.newaxis], labels]
+    return feats, labels
+
+def random_transpose_batches(batches, num_classes=_LABEL_NUM_CLASSES['majmin'],
+                             seed=dataloader._SEED):
+    """
+    Transpose each sequence of (feats, labels) `batches` by a uniformly random
+    shift (including 0), e.g. over `dataloader.IndexedSplit.batches`
+    """
+    rng = np.random.default_rng(seed)
+    for feats, labels in batches:
+        shifts = rng.integers(0, _NUM_SEMITONE, size=len(labels))
+        yield transpose(feats, labels, shifts, num_classes)
+
+
+def make_tf_transpose(num_classes=_LABEL_NUM_CLASSES['majmin'], seed=None):
+    """ Random transposition of batches as TF ops, for `pipeline.make_dataset(augment=...)` """
+    import tensorflow as tf # pylint: disable=import-outside-toplevel
+
+    perms = tf.constant(chroma_shift_perms(), dtype=tf.int32)
+    maps = tf.constant(label_shift_maps(num_classes), dtype=tf.int32)
+
+    def random_transpose(feats, labels):
+        shifts = tf.random.uniform(tf.shape(labels)[:1], maxval=_NUM_SEMITONE,
+                                   dtype=tf.int32, seed=seed)
+        feats = tf.gather(feats, tf.gather(perms, shifts), axis=2, batch_dims=1)
+        labels = tf.gather(tf.gather(maps, shifts), labels, axis=1, batch_dims=1)
+        return feats, labels
+
+    return random_transpose
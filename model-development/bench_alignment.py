@@ -0,0 +1,77 @@
+"""
+Parity check and benchmark of frame-to-chord label alignment over the
+McGill-Billboard set: `dataloader.align_chord_labels` against the reference
+per-chord loop (`dataloader._align_chord_labels_loop`)
+
+Run from `model-development`:
+    python bench_alignment.py --label-types majmin majmin7
+"""
+import argparse
+import time
+
+import numpy as np
+
+import dataloader
+from build_feature_store import find_song_ids
+
+
+def load_alignment_inputs(_id, label_type):
+    step_size, chroma_timestamps, _ = dataloader.get_chroma_matrix(_id,
+        return_timestamps=True, return_step_size=True)
+    chord_timestamps, chord_labels_str = dataloader.get_chord_labels(_id, label_type=label_type)
+    chord_labels = dataloader.encode_chords_single_label(chord_labels_str)
+    return chroma_timestamps, chord_timestamps, chord_labels, step_size
+
+
+def time_align(align_fn, inputs, remove_ambiguous):
+    """ Run `align_fn`, returns (output or exception type, seconds) """
+    st = time.perf_counter()
+    try:
+        out = align_fn(*inputs, remove_ambiguous=remove_ambiguous)
+    except AssertionError as e:
+        out = type(e)
+    return out, time.perf_counter() - st
+
+
+def same_output(ref_out, out):
+    if isinstance(ref_out, type) or isinstance(out, type):
+        return ref_out is out
+    return all(np.array_equal(r, o) for r, o in zip(ref_out, out))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--label-types', nargs='+', default=['majmin'])
+    parser.add_argument('--store-dir', default=dataloader._STORE_DIR,
+                        help='feature store of build_feature_store.py, used if built')
+    args = parser.parse_args()
+    dataloader.use_feature_store(args.store_dir)
+
+    ids = find_song_ids()
+    print(f'{"label type":>10s} {"remove_amb":>10s} {"songs":>6s} {"frames":>9s} '
+          f'{"loop(s)":>8s} {"vec(s)":>8s} {"speedup":>8s} {"mismatch":>8s}')
+    for label_type in args.label_types:
+        inputs = {_id: load_alignment_inputs(_id, label_type) for _id in ids}
+        num_frames = sum(len(song_inputs[0]) for song_inputs in inputs.values())
+
+        for remove_ambiguous in [True, False]:
+            ref_time, vec_time, mismatched = 0.0, 0.0, []
+            for _id, song_inputs in inputs.items():
+                ref_out, dur = time_align(dataloader._align_chord_labels_loop,
+                                          song_inputs, remove_ambiguous)
+                ref_time += dur
+                out, dur = time_align(dataloader.align_chord_labels, song_inputs, remove_ambiguous)
+                vec_time += dur
+                if not same_output(ref_out, out):
+                    mismatched.append(_id)
+
+            print(f'{label_type:>10s} {str(remove_ambiguous):>10s} {len(inputs):6d} '
+                  f'{num_frames:9d} {ref_time:8.3f} {vec_time:8.3f} '
+                  f'{ref_time/max(vec_time, 1e-9):7.1f}x {len(mismatched):8d}')
+            if mismatched:
+                print(f'  mismatched song IDs: {mismatched[:20]}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,104 @@
+"""
+Benchmark train/val/test splitting of the frame-level dataset
+(`SimpleChromaDataset.get_splits`): time and peak memory of the single-gather
+split against the previous per-class mask + concatenate-on-push path
+
+Run from `model-development`:
+    python bench_splits.py --files vectors.npy labels.npy
+or on synthetic data of about the Billboard majmin frame count:
+    python bench_splits.py --num-frames 1500000
+"""
+import argparse
+import time
+import tracemalloc
+
+import numpy as np
+
+import dataloader
+from dataloader import (SimpleChromaDataset, QueueData, _NUM_TEST_PER_CLASS,
+                        _NUM_VAL_PER_CLASS, _NUM_VAL_SPLITS, _MAJMIN_CLASSES)
+
+
+class LegacySplitData():
+    """ Previous SplitData, concatenating on every push """
+    def __init__(self, feats=None, labels=None):
+        self.feats = feats
+        self.labels = labels
+
+    def push(self, feats, labels):
+        self.feats = feats if self.feats is None else np.concatenate((self.feats, feats))
+        self.labels = labels if self.labels is None else np.concatenate((self.labels, labels))
+
+
+def legacy_get_splits(feats, labels, classes):
+    """ Previous `SimpleChromaDataset.get_splits` (without validation) """
+    test_split = LegacySplitData()
+    val_splits = [LegacySplitData() for i in range(_NUM_VAL_SPLITS)]
+    train_split = LegacySplitData()
+
+    for chord_class in sorted(classes):
+        mask = (labels==chord_class)
+        queue = QueueData(dataset=(feats[mask], labels[mask]))
+
+        test_split.push(*queue.take(_NUM_TEST_PER_CLASS))
+        for ix in range(_NUM_VAL_SPLITS):
+            val_splits[ix].push(*queue.take(_NUM_VAL_PER_CLASS))
+        train_split.push(*queue.flush())
+
+    return train_split, val_splits, test_split
+
+
+def new_get_splits(feats, labels, classes):
+    dataset = SimpleChromaDataset.__new__(SimpleChromaDataset) # skip loading files
+    dataset.chroma_vectors, dataset.chord_labels, dataset.classes = feats, labels, classes
+    train_split, val_splits, test_split = dataset.get_splits(validate=False)
+    for split in [train_split, *val_splits, test_split]: # as used by training
+        split.feats, split.labels # pylint: disable=pointless-statement
+    return train_split, val_splits, test_split
+
+
+def measure(split_fn, feats, labels, classes):
+    """ (splits, seconds, peak bytes allocated on top of the dataset) """
+    tracemalloc.start()
+    st = time.perf_counter()
+    splits = split_fn(feats, labels, classes)
+    dur = time.perf_counter() - st
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return splits, dur, peak
+
+
+def same_splits(splits_a, splits_b):
+    (train_a, vals_a, test_a), (train_b, vals_b, test_b) = splits_a, splits_b
+    return all(np.array_equal(a.feats, b.feats) and np.array_equal(a.labels, b.labels)
+               for a, b in zip([train_a, *vals_a, test_a], [train_b, *vals_b, test_b]))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--files', nargs=2, metavar=('VECTORS', 'LABELS'))
+    parser.add_argument('--num-frames', type=int, default=1500000)
+    args = parser.parse_args()
+
+    if args.files:
+        feats, labels = np.load(args.files[0]), np.load(args.files[1])
+    else:
+        rng = np.random.default_rng(dataloader._SEED)
+        feats = rng.random((args.num_frames, len(dataloader._CHROMA_FEAT_NAMES)))
+        labels = rng.integers(0, len(_MAJMIN_CLASSES), size=args.num_frames)
+    classes = set(labels.tolist())
+    print(f'{len(labels)} frames, {len(classes)} classes, dataset {feats.nbytes/2**20:.0f} MiB')
+
+    legacy, legacy_dur, legacy_peak = measure(legacy_get_splits, feats, labels, classes)
+    new, new_dur, new_peak = measure(new_get_splits, feats, labels, classes)
+    assert same_splits(legacy, new), 'splits differ'
+
+    print(f'{"path":>8s} {"time(s)":>8s} {"peak(MiB)":>10s}')
+    print(f'{"legacy":>8s} {legacy_dur:8.3f} {legacy_peak/2**20:10.1f}')
+    print(f'{"new":>8s} {new_dur:8.3f} {new_peak/2**20:10.1f}')
+    print(f'speedup {legacy_dur/new_dur:.1f}x, peak memory {legacy_peak/max(new_peak, 1):.1f}x lower')
+
+
+if __name__ == '__main__':
+    main()
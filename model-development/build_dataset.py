@@ -0,0 +1,46 @@
+"""
+Build the sharded sequence dataset for `dataloader.ChromaSequenceDataset`
+across a process pool. Interrupted builds resume from per-song checkpoints.
+
+Run from `model-development`:
+    python build_dataset.py --label-type majmin --seq-len 128 --workers 8
+then load with:
+    ChromaSequenceDataset(shard_dir='data/chordseq/majmin_128')
+"""
+import argparse
+import time
+
+import dataloader
+from build_feature_store import find_song_ids
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--ids', type=int, nargs='+', help='song IDs (default: all)')
+    parser.add_argument('--out-dir', help='default: data/chordseq/<label type>_<seq len>[_whole]')
+    parser.add_argument('--label-type', default='majmin')
+    parser.add_argument('--seq-len', type=int, default=dataloader._SEQ_LEN)
+    parser.add_argument('--keep-ambiguous', action='store_true',
+                        help='label whole songs (remove_ambiguous=False)')
+    parser.add_argument('--workers', type=int)
+    parser.add_argument('--songs-per-shard', type=int, default=dataloader._SONGS_PER_SHARD)
+    parser.add_argument('--keep-parts', action='store_true',
+                        help='keep per-song checkpoints after packing shards')
+    parser.add_argument('--store-dir', default=dataloader._STORE_DIR,
+                        help='feature store of build_feature_store.py, used if built')
+    args = parser.parse_args()
+    dataloader.use_feature_store(args.store_dir)
+
+    ids = args.ids or find_song_ids()
+    st = time.time()
+    failed = dataloader.build_sequence_dataset(
+        ids, out_dir=args.out_dir, label_type=args.label_type, seq_len=args.seq_len,
+        remove_ambiguous=not args.keep_ambiguous, workers=args.workers,
+        songs_per_shard=args.songs_per_shard, keep_parts=args.keep_parts)
+    print(f'Built {len(ids)-len(failed)} songs ({time.time()-st:.1f} s)'
+          + (f', failed: {failed}' if failed else ''))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,37 @@
+"""
+One-time ingest of McGill-Billboard chroma CSVs and LAB files into the binary
+feature store used by `dataloader` (see `dataloader.FeatureStore`)
+
+Run from `model-development`:
+    python build_feature_store.py
+A store built elsewhere with `--store-dir` is used by passing the same
+`--store-dir` to the other scripts (or `dataloader.use_feature_store`).
+"""
+import os
+import argparse
+import time
+
+import dataloader
+
+
+def find_song_ids(base_dir=dataloader._BASE_DIR):
+    """ IDs of song directories having chroma features """
+    return sorted(int(name) for name in os.listdir(base_dir)
+                  if name.isdigit() and os.path.exists(f'{base_dir}/{name}/bothchroma.csv'))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--store-dir', default=dataloader._STORE_DIR)
+    parser.add_argument('--label-types', nargs='+', default=dataloader._LABEL_TYPES)
+    args = parser.parse_args()
+
+    ids = find_song_ids()
+    st = time.time()
+    dataloader.build_feature_store(ids, store_dir=args.store_dir, label_types=args.label_types)
+    print(f'Stored {len(ids)} songs in {args.store_dir} ({time.time()-st:.1f} s)')
+
+
+if __name__ == '__main__':
+    main()
@@ -1,10 +1,15 @@
 """ Loader for Billboard data features and labels """
+import os
+import json
 import pickle
+from collections.abc import Mapping
+from concurrent.futures import ProcessPoolExecutor, as_completed
 import numpy as np
 from numpy.random import default_rng
 import pandas as pd
 import mir_eval
 import matplotlib.pyplot as plt
+import lazycats.np as catnp
 
 
 _SEED = 0
@@ -34,23 +39,148 @@ _MAJMIN7_CLASS_INDEX_MAP = {chord:index for index,chord in enumerate(_MAJMIN7_CL
 
 _NUM_SEMITONE = 12
 _BASE_DIR = 'data/McGill-Billboard'
+_STORE_DIR = 'data/McGill-Billboard-store'
+_LABEL_TYPES = ['majmin', 'majmin7', 'majmininv', 'majmin7inv', 'full']
+_FEATURE_STORE = None
+_FEATURE_STORE_DIR = _STORE_DIR # set by `use_feature_store`
+
+_SEQ_DIR = 'data/chordseq'
+_SEQ_LEN = 128
+_SONGS_PER_SHARD = 100
+
+
+#----------
+# Binary feature store
+class FeatureStore():
+    """
+    Consolidated binary store of Billboard chroma and chord labels, built once by
+    `build_feature_store`. All songs' chroma live in one contiguous float32 array
+    (memory-mapped), indexed by per-song offsets, so loading a song is a zero-copy
+    slice instead of parsing its CSV/LAB files.
+    """
+
+    def __init__(self, store_dir=_STORE_DIR):
+        self.store_dir = store_dir
+        self.song_ids = self._load('song_ids')
+        self.row_of_id = {_id: row for row, _id in enumerate(self.song_ids.tolist())}
+
+        self.chroma = self._load('chroma')
+        self.chroma_times = self._load('chroma_times')
+        self.chroma_offsets = self._load('chroma_offsets')
+
+        self.label_types = [label_type for label_type in _LABEL_TYPES
+                            if os.path.exists(self._path(f'{label_type}_offsets'))]
+        self.intervals, self.label_ixs, self.label_offsets, self.vocab = {}, {}, {}, {}
+        for label_type in self.label_types:
+            self.intervals[label_type] = self._load(f'{label_type}_intervals')
+            self.label_ixs[label_type] = self._load(f'{label_type}_label_ixs')
+            self.label_offsets[label_type] = self._load(f'{label_type}_offsets')
+            self.vocab[label_type] = self._load(f'{label_type}_vocab').tolist()
+
+    def _path(self, name):
+        return os.path.join(self.store_dir, f'{name}.npy')
+
+    def _load(self, name):
+        return np.load(self._path(name), mmap_mode='r')
+
+    def __contains__(self, _id):
+        return _id in self.row_of_id
+
+    def get_chroma(self, _id):
+        """ (start times, chroma vectors) of a song, as views into the store """
+        row = self.row_of_id[_id]
+        st, ed = self.chroma_offsets[row], self.chroma_offsets[row+1]
+        return self.chroma_times[st:ed], self.chroma[st:ed]
+
+    def get_labels(self, _id, label_type='majmin'):
+        """ (intervals, chord labels) of a song, like `mir_eval.io.load_labeled_intervals` """
+        row = self.row_of_id[_id]
+        offsets = self.label_offsets[label_type]
+        st, ed = offsets[row], offsets[row+1]
+        vocab = self.vocab[label_type]
+        return (self.intervals[label_type][st:ed],
+                [vocab[ix] for ix in self.label_ixs[label_type][st:ed]])
+
+
+def _save_store_array(store_dir, name, arr):
+    np.save(os.path.join(store_dir, f'{name}.npy'), arr)
+
+def build_feature_store(ids, store_dir=_STORE_DIR, label_types=_LABEL_TYPES):
+    """
+    One-time ingest of Billboard chroma (CSV) and chord labels (LAB) of songs
+    `ids` into a binary `FeatureStore` in `store_dir`
+    """
+    os.makedirs(store_dir, exist_ok=True)
+    ids = sorted(ids)
+
+    chroma, chroma_times = [], []
+    for _id in ids:
+        start_times, bothchroma = _read_chroma_csv(_id)
+        chroma.append(bothchroma)
+        chroma_times.append(start_times)
+
+    _save_store_array(store_dir, 'song_ids', np.array(ids, dtype=np.int64))
+    _save_store_array(store_dir, 'chroma', np.concatenate(chroma))
+    _save_store_array(store_dir, 'chroma_times', np.concatenate(chroma_times))
+    _save_store_array(store_dir, 'chroma_offsets',
+                      np.cumsum([0] + [len(song_chroma) for song_chroma in chroma]))
+    del chroma
+
+    for label_type in label_types:
+        intervals, label_ixs, vocab = [], [], {}
+        for _id in ids:
+            timestamps, chord_labels = _read_chord_labels_lab(_id, label_type)
+            intervals.append(timestamps)
+            label_ixs.append(np.array([vocab.setdefault(label, len(vocab))
+                                       for label in chord_labels], dtype=np.int32))
+
+        _save_store_array(store_dir, f'{label_type}_intervals', np.concatenate(intervals))
+        _save_store_array(store_dir, f'{label_type}_label_ixs', np.concatenate(label_ixs))
+        _save_store_array(store_dir, f'{label_type}_offsets',
+                          np.cumsum([0] + [len(song_ixs) for song_ixs in label_ixs]))
+        _save_store_array(store_dir, f'{label_type}_vocab', np.array(list(vocab), dtype=str))
+
+def use_feature_store(store_dir=_STORE_DIR):
+    """ Load songs from the feature store in `store_dir` (if built) from now on """
+    global _FEATURE_STORE, _FEATURE_STORE_DIR
+    _FEATURE_STORE, _FEATURE_STORE_DIR = None, store_dir
+
+def _get_feature_store():
+    """ Feature store in `_FEATURE_STORE_DIR`, or None if not built """
+    global _FEATURE_STORE
+    if ((_FEATURE_STORE is None)
+            and os.path.exists(os.path.join(_FEATURE_STORE_DIR, 'song_ids.npy'))):
+        _FEATURE_STORE = FeatureStore(_FEATURE_STORE_DIR)
+    return _FEATURE_STORE
 
 
 #----------
 # Billboard data loading functions
-def get_chroma_matrix(_id, return_timestamps=False, return_step_size=False):
-    """ Load bothchroma(bass-treble) vectors from Billboard dataset """
-    
+def _read_chroma_csv(_id):
     fn = f'{_BASE_DIR}/{_id:04d}/bothchroma.csv'
     contents = pd.read_csv(fn, header=None)
-    
+
     # we only get 3rd column onwards
     # (first column empty, 2nd column time tick)
-    bothchroma = contents[contents.columns[2:]].values
+    # float32, as kept in the feature store
+    bothchroma = contents[contents.columns[2:]].values.astype(np.float32)
+    start_times = contents[contents.columns[1]].values
+    return start_times, bothchroma
+
+def get_chroma_matrix(_id, return_timestamps=False, return_step_size=False):
+    """
+    Load bothchroma(bass-treble) vectors from Billboard dataset
+    (from the binary feature store if built, else from CSV)
+    """
+    store = _get_feature_store()
+    if (store is not None) and (_id in store):
+        start_times, bothchroma = store.get_chroma(_id)
+    else:
+        start_times, bothchroma = _read_chroma_csv(_id)
+
     if (not return_timestamps) and (not return_step_size):
         return bothchroma
     
-    start_times = contents[contents.columns[1]].values
     step_size = start_times[1]
     if not return_timestamps:
         return (step_size, bothchroma)
@@ -60,15 +190,21 @@ def get_chroma_matrix(_id, return_timestamps=False, return_step_size=False):
     return (step_size, timestamps, bothchroma)
 
 
+def _read_chord_labels_lab(_id, label_type):
+    lab_fn = f'{_BASE_DIR}/{_id:04d}/{label_type}.lab'
+    # any line starting w/ \n is ignored e.g. blank lines
+    return mir_eval.io.load_labeled_intervals(lab_fn, comment='\n')
+
 def get_chord_labels(_id, label_type='majmin'):
-    """ Load chord labels from .LAB files
+    """ Load chord labels from .LAB files (or the binary feature store if built)
     
     label_type: majmin, majmin7, majmininv, majmin7inv, full
     """
-    lab_fn = f'{_BASE_DIR}/{_id:04d}/{label_type}.lab'
-    # any line starting w/ \n is ignored e.g. blank lines
-    timestamps, chord_labels = mir_eval.io.load_labeled_intervals(lab_fn, comment='\n')
-    return timestamps, chord_labels
+    store = _get_feature_store()
+    if (store is not None) and (_id in store) and (label_type in store.label_types):
+        return store.get_labels(_id, label_type)
+
+    return _read_chord_labels_lab(_id, label_type)
 
 
 def encode_chords_single_label(chord_labels):
@@ -92,23 +228,11 @@ def encode_chords_single_label(chord_labels):
     return root_classes
 
 
-def get_chord_features_and_labels(_id, label_type='majmin', remove_ambiguous=True):
-    """ Get chroma vectors and chord labels
-
-    if not remove_ambiguous: label whole song
-
-    """
-    step_size, chroma_timestamps, chroma_vectors = get_chroma_matrix(_id,
-        return_timestamps=True,return_step_size=True)
-    chord_timestamps, chord_labels_str = get_chord_labels(_id, label_type=label_type)
-    chord_labels = encode_chords_single_label(chord_labels_str)
-
-    assert(len(chroma_timestamps) == len(chroma_vectors))
-    assert(len(chord_timestamps) == len(chord_labels))
-    n_labels = len(chord_labels)
-
+def _align_chord_labels_loop(chroma_timestamps, chord_timestamps, chord_labels, step_size,
+                             remove_ambiguous=True):
+    """ Reference implementation of `align_chord_labels`, masking all frames per chord """
     # label for each chroma vector
-    chromavec_labels = np.zeros(len(chroma_vectors)).astype(np.int)-1 # all -1's
+    chromavec_labels = np.zeros(len(chroma_timestamps)).astype(int)-1 # all -1's
     st_ix = 0 # lower bound for updating labels
     for i, (ts, chord_label) in enumerate(zip(chord_timestamps, chord_labels)):
         # get indices of chroma timestamps within duration of current chord
@@ -146,7 +270,6 @@ def get_chord_features_and_labels(_id, label_type='majmin', remove_ambiguous=Tru
         if len(TtoF_ixs) > 0:
             st_ix += (TtoF_ixs[0] + 1) # +1 due to offset by diffing to get transitions
 
-    # filter? np.all(chroma_vectors <= 0.01, axis=1)
     remove_ambiguous_mask = (chromavec_labels != -1)
     if not remove_ambiguous:
         if not all(remove_ambiguous_mask):
@@ -157,6 +280,100 @@ def get_chord_features_and_labels(_id, label_type='majmin', remove_ambiguous=Tru
 
         assert(all(remove_ambiguous_mask))
 
+    return chromavec_labels, remove_ambiguous_mask
+
+
+def align_chord_labels(chroma_timestamps, chord_timestamps, chord_labels, step_size,
+                       remove_ambiguous=True):
+    """
+    Label each chroma frame (rows of [start, end] in `chroma_timestamps`) with
+    the chord (`chord_timestamps`, numeric `chord_labels`) it falls in.
+    Returns (labels, mask), where mask is False for unlabeled (-1) frames.
+
+    Frames fully within a chord take its label. If not remove_ambiguous, a frame
+    straddling a chord boundary takes the chord it overlaps by at least half a
+    step (the earlier chord on a tie), and frames after the last chord are
+    labeled as in `_align_chord_labels_loop`.
+
+    Frame ranges of all chords are found at once by binary search over the
+    (sorted) frame boundaries; only the lower bound carried between chords is
+    computed per chord, in O(1).
+    """
+    num_frames = len(chroma_timestamps)
+    chromavec_labels = np.full(num_frames, -1, dtype=int)
+    if num_frames == 0:
+        return chromavec_labels, (chromavec_labels != -1)
+
+    starts, ends = chroma_timestamps[:, 0], chroma_timestamps[:, 1]
+    chord_starts, chord_ends = chord_timestamps[:, 0], chord_timestamps[:, 1]
+    half_step = step_size/2.0
+
+    # frames within each chord: [in_st, in_ed)
+    in_st = np.searchsorted(starts, chord_starts, side='left')
+    in_ed = np.searchsorted(ends, chord_ends, side='right')
+
+    # frames straddling chord start (head) and end (tail), where they overlap
+    # the chord by at least half a step
+    head_ixs = in_st - 1
+    head_safe = np.maximum(head_ixs, 0)
+    head_ok = (head_ixs >= 0) & (ends[head_safe] > chord_starts) \
+              & ((ends[head_safe]-chord_starts) >= half_step)
+    tail_ixs = in_ed
+    tail_safe = np.minimum(tail_ixs, num_frames-1)
+    tail_ok = (tail_ixs < num_frames) & (starts[tail_safe] < chord_ends) \
+              & ((chord_ends-starts[tail_safe]) >= half_step)
+
+    st_ix = 0 # lower bound for updating labels
+    for chord_label, st, ed, head_ix, head, tail_ix, tail in zip(
+            np.asarray(chord_labels).tolist(), in_st.tolist(), in_ed.tolist(),
+            head_ixs.tolist(), head_ok.tolist(), tail_ixs.tolist(), tail_ok.tolist()):
+        st = max(st, st_ix)
+        if st < ed:
+            chromavec_labels[st:ed] = chord_label
+
+        tail_taken = 0
+        if not remove_ambiguous:
+            if head and (head_ix >= st_ix):
+                chromavec_labels[head_ix] = chord_label
+            if tail and (tail_ix >= st_ix):
+                chromavec_labels[tail_ix] = chord_label
+                tail_taken = 1 # skip the overlap in next iteration
+
+        # move past the chord, unless it runs to the last frame
+        st_ix = (ed if st < ed < num_frames else st_ix) + tail_taken
+
+    remove_ambiguous_mask = (chromavec_labels != -1)
+    if not remove_ambiguous:
+        if not remove_ambiguous_mask.all():
+            assert(np.argmin(remove_ambiguous_mask) == st_ix)
+            chromavec_labels[st_ix] = chord_labels[-1] # assign last chord
+            chromavec_labels[st_ix+1:] = _NO_CHORD_INDEX # assign the rest as no-chord
+            remove_ambiguous_mask = (chromavec_labels != -1)
+
+        assert(remove_ambiguous_mask.all())
+
+    return chromavec_labels, remove_ambiguous_mask
+
+
+def get_chord_features_and_labels(_id, label_type='majmin', remove_ambiguous=True):
+    """ Get chroma vectors and chord labels
+
+    if not remove_ambiguous: label whole song
+
+    """
+    step_size, chroma_timestamps, chroma_vectors = get_chroma_matrix(_id,
+        return_timestamps=True,return_step_size=True)
+    chord_timestamps, chord_labels_str = get_chord_labels(_id, label_type=label_type)
+    chord_labels = encode_chords_single_label(chord_labels_str)
+
+    assert(len(chroma_timestamps) == len(chroma_vectors))
+    assert(len(chord_timestamps) == len(chord_labels))
+
+    # filter? np.all(chroma_vectors <= 0.01, axis=1)
+    chromavec_labels, remove_ambiguous_mask = align_chord_labels(
+        chroma_timestamps, chord_timestamps, chord_labels, step_size,
+        remove_ambiguous=remove_ambiguous)
+
     return chroma_vectors[remove_ambiguous_mask], chromavec_labels[remove_ambiguous_mask]
 
 
@@ -206,31 +423,110 @@ class QueueData():
 
 
 class SplitData():
-    """ Splitting helper class """
+    """
+    Splitting helper class
+
+    Pushed arrays are only collected, and concatenated once when `feats` or
+    `labels` is first accessed, so building a split is linear in its size.
+    """
     def __init__(self, feats=None, labels=None):
-        self.feats = feats
-        self.labels = labels
+        self._feats = [] if feats is None else [feats]
+        self._labels = [] if labels is None else [labels]
         
     def push(self, feats, labels):
         assert(len(feats)==len(labels))
-        if self.feats is None:
-            self.feats = feats
-        else:
-            self.feats = np.concatenate((self.feats, feats))
-        
-        if self.labels is None:
-            self.labels = labels
-        else:
-            self.labels = np.concatenate((self.labels, labels))
+        self._feats.append(feats)
+        self._labels.append(labels)
+
+    @staticmethod
+    def _concat(parts):
+        if len(parts) > 1:
+            parts[:] = [np.concatenate(parts)]
+        return parts[0] if parts else None
+
+    @property
+    def feats(self):
+        return self._concat(self._feats)
+
+    @feats.setter
+    def feats(self, feats):
+        self._feats = [] if feats is None else [feats]
+
+    @property
+    def labels(self):
+        return self._concat(self._labels)
+
+    @labels.setter
+    def labels(self, labels):
+        self._labels = [] if labels is None else [labels]
     
     def __len__(self):
-        return len(self.labels)
+        return sum(len(labels) for labels in self._labels)
 
     @property
     def shape(self):
         return (self.feats.shape, self.labels.shape)
 
 
+class IndexedSplit():
+    """
+    Split as rows of shared backing arrays instead of a copy of them.
+    `sources` is a list of (feats, labels) arrays, row i of the split is row
+    `row_ixs[i]` of source `source_ixs[i]`. Rows are gathered on demand:
+    `batches` for lazily gathered batches, `take` for any rows, while `feats`
+    and `labels` materialize the whole split like `SplitData`.
+    """
+    def __init__(self, sources, source_ixs, row_ixs):
+        assert(len(source_ixs) == len(row_ixs))
+        self.sources = sources
+        self.source_ixs = np.asarray(source_ixs, dtype=np.int64)
+        self.row_ixs = np.asarray(row_ixs, dtype=np.int64)
+
+    def __len__(self):
+        return len(self.row_ixs)
+
+    @property
+    def shape(self):
+        feats, labels = self.sources[0]
+        return ((len(self), *feats.shape[1:]), (len(self), *labels.shape[1:]))
+
+    def take(self, ixs):
+        """ Gather (feats, labels) of split rows `ixs`, in order """
+        ixs = np.asarray(ixs, dtype=np.int64)
+        source_ixs, row_ixs = self.source_ixs[ixs], self.row_ixs[ixs]
+        source_feats, source_labels = self.sources[0]
+        feats = np.empty((len(ixs), *source_feats.shape[1:]), dtype=source_feats.dtype)
+        labels = np.empty((len(ixs), *source_labels.shape[1:]), dtype=source_labels.dtype)
+
+        # one fancy-indexing read per source, rows in ascending order within it
+        order = np.lexsort((row_ixs, source_ixs))
+        bounds = np.flatnonzero(np.diff(source_ixs[order])) + 1
+        for group in np.split(order, bounds):
+            if len(group) == 0:
+                continue
+            source_feats, source_labels = self.sources[source_ixs[group[0]]]
+            feats[group] = source_feats[row_ixs[group]]
+            labels[group] = source_labels[row_ixs[group]]
+
+        return feats, labels
+
+    def batches(self, batch_size, shuffle=False, seed=_SEED):
+        """ Generator of (feats, labels) batches, gathered as they are requested """
+        order = np.arange(len(self))
+        if shuffle:
+            default_rng(seed=seed).shuffle(order)
+        for st in range(0, len(order), batch_size):
+            yield self.take(order[st:st+batch_size])
+
+    @property
+    def feats(self):
+        return self.take(np.arange(len(self)))[0]
+
+    @property
+    def labels(self):
+        return self.take(np.arange(len(self)))[1]
+
+
 class SimpleChromaDataset():
     """
     Simple dataset wherein features are chroma vectors generated from Chordino
@@ -269,28 +565,61 @@ class SimpleChromaDataset():
         """
         feats, labels = self.chroma_vectors, self.chord_labels
 
-        classes = list(self.classes)
-        classes.sort()
-        
         if validate:
+            classes = sorted(self.classes)
             hist, _ = np.histogram(labels, bins=classes)
             assert(min(hist) >= (_NUM_TEST_PER_CLASS + (_NUM_VAL_SPLITS*_NUM_VAL_PER_CLASS)))
-        
-        test_split = SplitData()
-        val_splits = [SplitData() for i in range(_NUM_VAL_SPLITS)]
-        train_split = SplitData()
-        
-        for chord_class in classes:
-            mask = (labels==chord_class)
-            queue = QueueData(dataset=(feats[mask], labels[mask]))
-            
-            test_split.push(*queue.take(_NUM_TEST_PER_CLASS))
-            for ix in range(_NUM_VAL_SPLITS):
-                val_splits[ix].push(*queue.take(_NUM_VAL_PER_CLASS))
-            train_split.push(*queue.flush())
+
+        # one gather per split
+        train_ixs, val_ixs, test_ixs = self.get_split_indices()
+        test_split = SplitData(feats[test_ixs], labels[test_ixs])
+        val_splits = [SplitData(feats[ixs], labels[ixs]) for ixs in val_ixs]
+        train_split = SplitData(feats[train_ixs], labels[train_ixs])
 
         return train_split, val_splits, test_split
 
+    def get_split_indices(self):
+        """
+        Row indices of training, validation, and test sets: per class (in order),
+        the first `_NUM_TEST_PER_CLASS` rows go to test, the next
+        `_NUM_VAL_PER_CLASS` to each validation split, the rest to training
+        """
+        labels = np.asarray(self.chord_labels)
+        classes = np.array(sorted(self.classes))
+
+        # rows grouped by class in one pass, keeping row order within class
+        order = np.argsort(labels, kind='stable')
+        class_st = np.searchsorted(labels[order], classes, side='left')
+        class_ed = np.searchsorted(labels[order], classes, side='right')
+
+        def rows(st_offset, ed_offset):
+            st = np.minimum(class_st + st_offset, class_ed)
+            ed = class_ed if ed_offset is None else np.minimum(class_st + ed_offset, class_ed)
+            return np.concatenate([order[a:b] for a, b in zip(st, ed)] or [order[:0]])
+
+        test_ixs = rows(0, _NUM_TEST_PER_CLASS)
+        val_ixs = []
+        for ix in range(_NUM_VAL_SPLITS):
+            st = _NUM_TEST_PER_CLASS + ix*_NUM_VAL_PER_CLASS
+            val_ixs.append(rows(st, st+_NUM_VAL_PER_CLASS))
+        train_ixs = rows(_NUM_TEST_PER_CLASS + _NUM_VAL_SPLITS*_NUM_VAL_PER_CLASS, None)
+
+        return train_ixs, val_ixs, test_ixs
+
+    def get_cv_folds(self):
+        """
+        Cross-validation folds generator like `get_next_cv_split`, but folds are
+        `IndexedSplit`s over the dataset arrays, so no fold copies the data
+        """
+        train_ixs, val_ixs, _ = self.get_split_indices()
+        sources = [(self.chroma_vectors, self.chord_labels)]
+
+        num_cv = len(val_ixs)
+        for v_ix in range(num_cv): # index of val split at a specific round
+            full_train_ixs = np.concatenate((train_ixs, *val_ixs[0:v_ix], *val_ixs[v_ix+1:]))
+            yield (IndexedSplit(sources, np.zeros(len(full_train_ixs)), full_train_ixs),
+                   IndexedSplit(sources, np.zeros(len(val_ixs[v_ix])), val_ixs[v_ix]))
+
     def get_next_cv_split(self):
         """ Cross-validation splits generator """
         assert ((self.train_split is not None) and (self.val_splits is not None))
@@ -309,23 +638,176 @@ class SimpleChromaDataset():
             yield full_train_split, val_split
 
 
+#----------
+# Sharded sequence dataset
+def _sequence_part_path(out_dir, _id):
+    return os.path.join(out_dir, 'parts', f'{_id:04d}.npz')
+
+def _sequence_shard_path(out_dir, shard_ix, name):
+    return os.path.join(out_dir, f'shard_{shard_ix:04d}_{name}.npy')
+
+def _build_song_sequences(_id, out_dir, label_type, seq_len, remove_ambiguous):
+    """ Chunk one song into sequences, checkpointed as its own part file """
+    chroma_vectors, chord_labels = get_chord_features_and_labels(_id, label_type=label_type,
+                                                                 remove_ambiguous=remove_ambiguous)
+    assert(chroma_vectors.shape[-1] == len(_CHROMA_FEAT_NAMES))
+    feats = catnp.divide_to_subsequences(chroma_vectors, sub_len=seq_len).astype(np.float32)
+    labels = catnp.divide_to_subsequences(chord_labels, sub_len=seq_len).astype(np.int32)
+
+    part_fn = _sequence_part_path(out_dir, _id)
+    tmp_fn = f'{part_fn}.{os.getpid()}.tmp'
+    with open(tmp_fn, 'wb') as f:
+        np.savez(f, feats=feats, labels=labels)
+    os.replace(tmp_fn, part_fn) # part only exists once complete
+    return _id
+
+def _pack_sequence_shards(out_dir, ids, songs_per_shard):
+    """ Concatenate part files of songs `ids` into shards, writing the index last """
+    song_shards, song_offsets, song_counts = [], [], []
+    for shard_ix, st in enumerate(range(0, len(ids), songs_per_shard)):
+        feats, labels = [], []
+        for _id in ids[st:st+songs_per_shard]:
+            with np.load(_sequence_part_path(out_dir, _id)) as part:
+                feats.append(part['feats'])
+                labels.append(part['labels'])
+
+        counts = [len(song_labels) for song_labels in labels]
+        song_shards.extend([shard_ix]*len(counts))
+        song_offsets.extend(np.cumsum([0] + counts[:-1]).tolist())
+        song_counts.extend(counts)
+        np.save(_sequence_shard_path(out_dir, shard_ix, 'feats'), np.concatenate(feats))
+        np.save(_sequence_shard_path(out_dir, shard_ix, 'labels'), np.concatenate(labels))
+
+    index_fn = os.path.join(out_dir, 'index.npz')
+    with open(f'{index_fn}.tmp', 'wb') as f:
+        np.savez(f, song_ids=np.array(ids, dtype=np.int64),
+                 shards=np.array(song_shards, dtype=np.int64),
+                 offsets=np.array(song_offsets, dtype=np.int64),
+                 counts=np.array(song_counts, dtype=np.int64))
+    os.replace(f'{index_fn}.tmp', index_fn)
+
+def build_sequence_dataset(ids, out_dir=None, label_type='majmin', seq_len=_SEQ_LEN,
+                           remove_ambiguous=True, workers=None,
+                           songs_per_shard=_SONGS_PER_SHARD, keep_parts=False):
+    """
+    Extract features and labels of songs `ids` (`get_chord_features_and_labels`)
+    and chunk them into sequences of `seq_len`, one process pool task per song.
+
+    Each finished song is checkpointed to `out_dir/parts`, so re-running an
+    interrupted build only processes the remaining songs. Parts are then packed
+    into shards of `songs_per_shard` songs (float32 feats, int32 labels as
+    `.npy`), which `SequenceShards` memory-maps. Parts are removed after packing
+    unless `keep_parts`, or some songs failed. Returns IDs of failed songs.
+    """
+    out_dir = out_dir or (f'{_SEQ_DIR}/{label_type}_{seq_len}'
+                          + ('' if remove_ambiguous else '_whole'))
+    os.makedirs(os.path.join(out_dir, 'parts'), exist_ok=True)
+    ids = sorted(ids)
+
+    # parts of a different configuration cannot be resumed from
+    params = {'label_type': label_type, 'seq_len': seq_len, 'remove_ambiguous': remove_ambiguous}
+    params_fn = os.path.join(out_dir, 'parts', 'params.json')
+    if os.path.exists(params_fn):
+        with open(params_fn) as f:
+            if json.load(f) != params:
+                raise ValueError(f'Parts in {out_dir} were built with other parameters; '
+                                 f'remove them or use another out_dir')
+    else:
+        with open(params_fn, 'w') as f:
+            json.dump(params, f)
+
+    todo = [_id for _id in ids if not os.path.exists(_sequence_part_path(out_dir, _id))]
+    print(f'{len(ids)-len(todo)} of {len(ids)} songs already done.')
+
+    failed = []
+    if todo:
+        with ProcessPoolExecutor(max_workers=workers, initializer=use_feature_store,
+                                 initargs=(_FEATURE_STORE_DIR,)) as executor:
+            futures = {executor.submit(_build_song_sequences, _id, out_dir, label_type,
+                                       seq_len, remove_ambiguous): _id for _id in todo}
+            for num_done, future in enumerate(as_completed(futures), 1):
+                try:
+                    future.result()
+                except Exception as e:
+                    failed.append(futures[future])
+                    print(f'Error {e!r} at {futures[future]}')
+
+                if num_done % 100 == 0:
+                    print(f'{num_done}/{len(todo)} songs processed.')
+
+    failed_ids = set(failed)
+    done_ids = [_id for _id in ids if _id not in failed_ids]
+    _pack_sequence_shards(out_dir, done_ids, songs_per_shard)
+    with open(os.path.join(out_dir, 'meta.json'), 'w') as f:
+        json.dump({**params, 'failed': sorted(failed)}, f)
+
+    # with failed songs, keep all parts so a re-run only retries those
+    if not (keep_parts or failed):
+        for _id in done_ids:
+            os.remove(_sequence_part_path(out_dir, _id))
+        os.remove(params_fn)
+
+    return sorted(failed)
+
+
+class SequenceShards(Mapping):
+    """
+    Read-only {song ID: {'feats': ..., 'labels': ...}} mapping over shards from
+    `build_sequence_dataset`. Shards are memory-mapped, so songs are loaded
+    lazily as views instead of deserializing the whole dataset.
+    """
+
+    def __init__(self, shard_dir):
+        self.shard_dir = shard_dir
+        with open(os.path.join(shard_dir, 'meta.json')) as f:
+            self.meta = json.load(f)
+        with np.load(os.path.join(shard_dir, 'index.npz')) as index:
+            self.song_ids = index['song_ids']
+            self.shards, self.offsets, self.counts = index['shards'], index['offsets'], index['counts']
+        self.row_of_id = {_id: row for row, _id in enumerate(self.song_ids.tolist())}
+
+        num_shards = int(self.shards.max())+1 if len(self.shards) else 0
+        self.feats = [np.load(_sequence_shard_path(shard_dir, shard_ix, 'feats'), mmap_mode='r')
+                      for shard_ix in range(num_shards)]
+        self.labels = [np.load(_sequence_shard_path(shard_dir, shard_ix, 'labels'), mmap_mode='r')
+                       for shard_ix in range(num_shards)]
+
+    def __getitem__(self, _id):
+        row = self.row_of_id[_id]
+        shard_ix, st = self.shards[row], self.offsets[row]
+        ed = st+self.counts[row]
+        return {'feats': self.feats[shard_ix][st:ed], 'labels': self.labels[shard_ix][st:ed]}
+
+    def __iter__(self):
+        return iter(self.song_ids.tolist())
+
+    def __len__(self):
+        return len(self.song_ids)
+
+
 class ChromaSequenceDataset():
     """
     Chroma vectors are batched into sequences
     """
 
-    def __init__(self, pre_computed_sequence=None):
+    def __init__(self, pre_computed_sequence=None, shard_dir=None):
         """
-        feat_label_files: tuple of NumPy binary files to load the data from,
-            interpreted as (vector_array_file, label_array_file)
+        pre_computed_sequence: pickle file of {song ID: {'feats', 'labels'}}
+        shard_dir: directory of shards from `build_sequence_dataset`
+            (see build_dataset.py), memory-mapped instead of loaded to RAM
         """
         self.chordseq_dict = None
-        if pre_computed_sequence:
+        self._sources, self._song_loc = None, None # backing arrays of `get_cv_folds`
+        if shard_dir:
+            self.chordseq_dict = SequenceShards(shard_dir)
+
+        elif pre_computed_sequence:
             with open(pre_computed_sequence, 'rb') as f:
                 self.chordseq_dict = pickle.load(f)
 
-        else: #TODO: implement extracting vectors and labels from raw files
-            raise NotImplementedError
+        else:
+            raise ValueError('Build sequences first with build_dataset.py, '
+                             'then pass shard_dir (or a pre_computed_sequence pickle)')
 
         print('Loaded sequence data.')
 
@@ -351,4 +833,49 @@ class ChromaSequenceDataset():
             if return_index:
                 yield train_split, val_split, train_idxs, val_idxs
             else:
-                yield train_split, val_split
\ No newline at end of file
+                yield train_split, val_split
+
+    def _song_rows(self, ids):
+        """ (source index, row) of all sequences of songs `ids` """
+        if self._sources is None:
+            chordseq_dict = self.chordseq_dict
+            if isinstance(chordseq_dict, SequenceShards): # shards as sources
+                self._sources = list(zip(chordseq_dict.feats, chordseq_dict.labels))
+                self._song_loc = {_id: (shard_ix, st, count) for _id, shard_ix, st, count in zip(
+                    chordseq_dict.song_ids.tolist(), chordseq_dict.shards.tolist(),
+                    chordseq_dict.offsets.tolist(), chordseq_dict.counts.tolist())}
+            else: # songs as sources
+                self._sources = [(seqs['feats'], seqs['labels']) for seqs in chordseq_dict.values()]
+                self._song_loc = {_id: (source_ix, 0, len(seqs['labels']))
+                                  for source_ix, (_id, seqs) in enumerate(chordseq_dict.items())}
+
+        locs = np.array([self._song_loc[_id] for _id in ids], dtype=np.int64).reshape(-1, 3)
+        source_ixs = np.repeat(locs[:, 0], locs[:, 2])
+        # row = song start + position within song
+        song_firsts = np.cumsum(locs[:, 2]) - locs[:, 2]
+        row_ixs = np.arange(len(source_ixs)) + np.repeat(locs[:, 1]-song_firsts, locs[:, 2])
+        return source_ixs, row_ixs
+
+    def get_cv_folds(self, ref_idxs, num_folds=5, num_val=100, return_index=False):
+        """
+        Cross-validation folds generator like `get_next_cv_split`, but splits are
+        `IndexedSplit`s over the (shared) per-song or shard arrays, so folds do
+        not copy the data. Train songs keep the order of `ref_idxs`.
+        """
+        assert(len(ref_idxs) >= (num_folds*num_val))
+        ref_idxs = np.asarray(ref_idxs)
+        for i in range(num_folds):
+            st = i*num_val
+            ed = st+num_val
+
+            val_idxs = ref_idxs[st:ed]
+            train_idxs = np.concatenate((ref_idxs[:st], ref_idxs[ed:]))
+
+            train_rows, val_rows = self._song_rows(train_idxs), self._song_rows(val_idxs)
+            train_split = IndexedSplit(self._sources, *train_rows)
+            val_split = IndexedSplit(self._sources, *val_rows)
+
+            if return_index:
+                yield train_split, val_split, train_idxs, val_idxs
+            else:
+                yield train_split, val_split
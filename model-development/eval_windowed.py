@@ -0,0 +1,55 @@
+"""
+Accuracy vs. throughput of overlapping-window inference on Billboard songs
+
+Run from `model-development` (expects data in `data/McGill-Billboard`):
+    python eval_windowed.py --hops 128 96 64 32
+"""
+import argparse
+import time
+
+import numpy as np
+
+import autochord
+import dataloader
+
+
+_TEST_IDS = [1289, 736, 637, 270, 18] # same test songs as in eval_seq.ipynb
+_LABEL_TYPE = 'majmin'
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--ids', type=int, nargs='+', default=_TEST_IDS)
+    parser.add_argument('--hops', type=int, nargs='+', default=[96, 64, 32])
+    parser.add_argument('--backend', default='keras')
+    parser.add_argument('--store-dir', default=dataloader._STORE_DIR,
+                        help='feature store of build_feature_store.py, used if built')
+    args = parser.parse_args()
+    dataloader.use_feature_store(args.store_dir)
+
+    songs = [dataloader.get_chord_features_and_labels(_id, label_type=_LABEL_TYPE,
+                                                      remove_ambiguous=False)
+             for _id in args.ids]
+    num_frames = sum(len(labels) for _, labels in songs)
+    autochord.warmup(backend=args.backend)
+
+    configs = [(None, None)] + [(hop, merge) for hop in args.hops
+                                for merge in autochord.windowed._MERGES]
+    print(f'{len(songs)} songs, {num_frames} frames')
+    print(f'{"hop":>5s} {"merge":>10s} {"acc":>7s} {"frames/s":>9s}')
+    for hop, merge in configs:
+        num_correct = 0
+        st = time.perf_counter()
+        for chroma_vectors, chord_labels in songs:
+            pred_labels = autochord.predict_chord_labels(chroma_vectors, backend=args.backend,
+                                                         hop=hop, merge=merge)
+            num_correct += np.sum(pred_labels == chord_labels)
+        dur = time.perf_counter() - st
+
+        print(f'{hop or "-":>5} {merge or "blocks":>10s} {num_correct/num_frames:7.4f} '
+              f'{num_frames/dur:9.0f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,339 @@
+"""
+Evaluate a chord model on Billboard songs: batched inference on stored chroma,
+then frame accuracy and weighted chord symbol recall (WCSR, majmin and
+sevenths comparisons) per song, scored on a process pool, with per-song and
+aggregate reports
+
+Reference data (frame labels aligned to chroma, reference segments) is built
+once per label type and cached in `data/eval`.
+
+Run from `model-development`:
+    python evaluate.py --split test
+    python evaluate.py --split val --fold 0 --model-dir models/chroma-seq-bilstm-crf-0
+    python evaluate.py --check-tables
+"""
+import os
+import json
+import argparse
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+import mir_eval
+
+import autochord
+import dataloader
+
+
+_TEST_IDS = [1289, 736, 637, 270, 18] # same test songs as in eval_seq.ipynb
+_SONG_INDEX = f'{dataloader._BASE_DIR}/billboard-2.0-manychords.csv'
+_EVAL_DIR = 'data/eval'
+
+def _mir_eval_label(label):
+    """ Model class name in mir_eval syntax: dominant sevenths ('C7') become 'C:7' """
+    if label == dataloader._NO_CHORD or ':' in label:
+        return label
+    return f'{label[:-1]}:7'
+
+# model classes per label type, in mir_eval syntax
+_CLASSES = {label_type: [_mir_eval_label(label) for label in classes]
+            for label_type, classes in [('majmin', dataloader._MAJMIN_CLASSES),
+                                        ('majmin7', dataloader._MAJMIN7_CLASSES)]}
+
+# WCSR metric: (reference LAB type, mir_eval comparison)
+_WCSR_METRICS = {
+    'majmin': ('majmin', mir_eval.chord.majmin),
+    'sevenths': ('majmin7', mir_eval.chord.sevenths),
+}
+_REF_LAB_TYPES = sorted({lab_type for lab_type, _ in _WCSR_METRICS.values()})
+
+_SONGS_PER_BATCH = 64   # songs whose subsequences are predicted together
+_SONGS_PER_TASK = 16    # songs scored per process pool task
+
+
+#----------
+# Song selection
+def get_split_ids(split, fold=0, num_val=100):
+    """
+    Song IDs of `split`: 'test' (held-out songs), 'val' (validation songs of
+    CV `fold`, with the shuffling of eval_seq.ipynb) or 'all' (feature store)
+    """
+    if split == 'test':
+        return list(_TEST_IDS)
+
+    if split == 'val':
+        song_ids = pd.read_csv(_SONG_INDEX)['id'].values
+        ref_idxs = song_ids[~np.isin(song_ids, _TEST_IDS)]
+        np.random.default_rng(dataloader._SEED).shuffle(ref_idxs)
+        return ref_idxs[fold*num_val:(fold+1)*num_val].tolist()
+
+    if split == 'all':
+        store = dataloader._get_feature_store()
+        if store is None:
+            raise ValueError('Build the feature store first with build_feature_store.py')
+        return store.song_ids.tolist()
+
+    raise ValueError(f'Unknown split `{split}`')
+
+
+#----------
+# Reference data
+def _song_reference(_id, label_type):
+    """ Chroma frame start times, step size, aligned frame labels, {LAB type: (intervals, labels)} """
+    step_size, chroma_timestamps, _ = dataloader.get_chroma_matrix(
+        _id, return_timestamps=True, return_step_size=True)
+    chord_timestamps, chord_labels = dataloader.get_chord_labels(_id, label_type=label_type)
+    frame_labels, _ = dataloader.align_chord_labels(
+        chroma_timestamps, chord_timestamps, dataloader.encode_chords_single_label(chord_labels),
+        step_size, remove_ambiguous=False)
+
+    segments = {lab_type: dataloader.get_chord_labels(_id, label_type=lab_type)
+                for lab_type in _REF_LAB_TYPES}
+    return np.asarray(chroma_timestamps)[:, 0], step_size, frame_labels, segments
+
+def _reference_path(label_type):
+    return os.path.join(_EVAL_DIR, f'reference_{label_type}.npz')
+
+def build_reference(ids, label_type='majmin', workers=None):
+    """ Reference data of songs `ids`, flattened into arrays with per-song offsets """
+    with ProcessPoolExecutor(max_workers=workers, initializer=dataloader.use_feature_store,
+                             initargs=(dataloader._FEATURE_STORE_DIR,)) as executor:
+        songs = list(executor.map(_song_reference, ids, [label_type]*len(ids)))
+
+    ref = {'song_ids': np.array(ids, dtype=np.int64),
+           'step_sizes': np.array([step_size for _, step_size, _, _ in songs]),
+           'frame_times': np.concatenate([times for times, _, _, _ in songs]),
+           'frame_labels': np.concatenate([labels for _, _, labels, _ in songs]).astype(np.int32),
+           'frame_offsets': np.cumsum([0] + [len(labels) for _, _, labels, _ in songs])}
+
+    for lab_type in _REF_LAB_TYPES:
+        vocab = {}
+        label_ixs = [np.array([vocab.setdefault(label, len(vocab))
+                               for label in segments[lab_type][1]], dtype=np.int32)
+                     for _, _, _, segments in songs]
+        ref[f'{lab_type}_intervals'] = np.concatenate(
+            [segments[lab_type][0] for _, _, _, segments in songs]).reshape(-1, 2)
+        ref[f'{lab_type}_label_ixs'] = np.concatenate(label_ixs)
+        ref[f'{lab_type}_offsets'] = np.cumsum([0] + [len(ixs) for ixs in label_ixs])
+        ref[f'{lab_type}_vocab'] = np.array(list(vocab), dtype=str)
+    return ref
+
+def load_reference(ids, label_type='majmin', workers=None, rebuild=False):
+    """ Reference data of songs `ids` (in that order), from the cache, (re)built if needed """
+    cache_fn = _reference_path(label_type)
+    ref = None
+    if os.path.exists(cache_fn) and not rebuild:
+        with np.load(cache_fn) as cached:
+            ref = dict(cached)
+
+    if (ref is None) or not np.isin(ids, ref['song_ids']).all():
+        cached_ids = [] if ref is None else ref['song_ids'].tolist()
+        all_ids = sorted(set(cached_ids) | set(ids))
+        print(f'Building reference data of {len(all_ids)} songs...')
+        ref = build_reference(all_ids, label_type=label_type, workers=workers)
+        os.makedirs(_EVAL_DIR, exist_ok=True)
+        np.savez(cache_fn, **ref)
+
+    row_of_id = {_id: row for row, _id in enumerate(ref['song_ids'].tolist())}
+    ref['rows'] = np.array([row_of_id[_id] for _id in ids], dtype=np.int64)
+    return ref
+
+def _song_slice(offsets, row):
+    return slice(offsets[row], offsets[row+1])
+
+
+#----------
+# Inference
+def make_predictor(backend='keras', model_dir=None):
+    """ Subsequence predictor: autochord's model on `backend`, or a Keras checkpoint """
+    if model_dir is None:
+        autochord.warmup(backend=backend)
+        return lambda x: autochord._predict_subsequences(x, backend=backend)
+
+    from tensorflow import keras
+    from autochord.compiled_model import CompiledChordModel
+    return CompiledChordModel(keras.models.load_model(model_dir)).predict
+
+def predict_songs(predict, ids, songs_per_batch=_SONGS_PER_BATCH):
+    """ Frame labels of stored chroma of songs `ids`, subsequences of many songs per call """
+    pred_labels = []
+    for st in range(0, len(ids), songs_per_batch):
+        chromas = [dataloader.get_chroma_matrix(_id) for _id in ids[st:st+songs_per_batch]]
+        subseqs = [autochord._to_subsequences(np.asarray(chroma, dtype=np.float32))
+                   for chroma in chromas]
+        preds = predict(np.concatenate(subseqs))
+        bounds = np.cumsum([0] + [len(song_subseqs) for song_subseqs in subseqs])
+        pred_labels += [autochord._from_subsequences(preds[seq_st:seq_ed], len(chroma))
+                        for chroma, seq_st, seq_ed in zip(chromas, bounds[:-1], bounds[1:])]
+    return pred_labels
+
+
+#----------
+# Scoring
+_SCORE_TABLES = None # per process, set by `_init_scoring`
+
+def comparison_tables(ref, classes):
+    """ {metric: (reference vocab, model classes) mir_eval comparison scores, -1 if excluded} """
+    tables = {}
+    for metric, (lab_type, compare) in _WCSR_METRICS.items():
+        vocab = ref[f'{lab_type}_vocab'].tolist()
+        tables[metric] = compare(np.repeat(vocab, len(classes)).tolist(),
+                                 list(classes)*len(vocab)).reshape(len(vocab), len(classes))
+    return tables
+
+def check_comparison_tables():
+    """
+    Build the comparison tables of every label type, with the model classes as
+    reference vocab, and check that each class fully matches itself
+    """
+    for label_type, classes in _CLASSES.items():
+        ref = {f'{lab_type}_vocab': np.array(classes, dtype=str) for lab_type in _REF_LAB_TYPES}
+        for metric, table in comparison_tables(ref, classes).items():
+            if not (np.diag(table) == 1).all():
+                mismatched = np.array(classes)[np.diag(table) != 1].tolist()
+                raise ValueError(f'{label_type} classes not matching themselves '
+                                 f'under `{metric}`: {mismatched}')
+        print(f'{label_type}: comparison tables of {len(classes)} classes OK')
+
+def _init_scoring(tables):
+    global _SCORE_TABLES
+    _SCORE_TABLES = tables
+
+def segment_scores(ref_intervals, ref_ixs, frame_times, step_size, pred_labels, table):
+    """
+    (score sum, duration) over the reference span, comparing each reference
+    segment against predicted frames (`step_size` long, 'N' outside), weighted
+    by the duration of their overlaps; excluded reference chords do not count
+    """
+    if len(ref_intervals) == 0:
+        return 0.0, 0.0
+
+    span_st, span_ed = ref_intervals[0, 0], ref_intervals[-1, 1]
+    bounds = np.unique(np.concatenate((ref_intervals.ravel(), frame_times,
+                                       frame_times[-1:] + step_size)))
+    bounds = np.clip(bounds, span_st, span_ed)
+    bounds = bounds[np.concatenate(([True], np.diff(bounds) > 0))]
+    durations, mids = np.diff(bounds), (bounds[1:] + bounds[:-1])/2
+
+    ref_rows = np.searchsorted(ref_intervals[:, 0], mids, side='right') - 1
+    in_ref = mids < ref_intervals[ref_rows, 1] # outside of gaps between reference segments
+
+    frame_ixs = np.searchsorted(frame_times, mids, side='right') - 1
+    in_pred = (frame_ixs >= 0) & (mids < frame_times[-1] + step_size)
+    est = np.where(in_pred, pred_labels[np.clip(frame_ixs, 0, len(pred_labels)-1)],
+                   dataloader._NO_CHORD_INDEX)
+
+    scores = table[ref_ixs[ref_rows], est]
+    counted = in_ref & (scores >= 0)
+    return float(np.sum(scores[counted]*durations[counted])), float(np.sum(durations[counted]))
+
+def score_song(song):
+    """ Scores of one song: dict of frames, correct frames, per-metric WCSR score sum and duration """
+    _id, pred_labels, frame_labels, frame_times, step_size, segments = song
+    out = {'id': _id, 'frames': len(frame_labels),
+           'correct': int(np.sum(pred_labels == frame_labels))}
+    for metric, (lab_type, _) in _WCSR_METRICS.items():
+        ref_intervals, ref_ixs = segments[lab_type]
+        out[f'{metric}_score'], out[f'{metric}_duration'] = segment_scores(
+            ref_intervals, ref_ixs, frame_times, step_size, pred_labels, _SCORE_TABLES[metric])
+    return out
+
+def _score_songs(songs):
+    return [score_song(song) for song in songs]
+
+def score_songs(ids, pred_labels, ref, tables, workers=None, songs_per_task=_SONGS_PER_TASK):
+    """ Per-song scores, songs split into tasks of `songs_per_task` on a process pool """
+    songs = []
+    for _id, row, song_preds in zip(ids, ref['rows'], pred_labels):
+        frames = _song_slice(ref['frame_offsets'], row)
+        segments = {}
+        for lab_type in _REF_LAB_TYPES:
+            segs = _song_slice(ref[f'{lab_type}_offsets'], row)
+            segments[lab_type] = (ref[f'{lab_type}_intervals'][segs],
+                                  ref[f'{lab_type}_label_ixs'][segs])
+        songs.append((_id, np.asarray(song_preds), ref['frame_labels'][frames],
+                      ref['frame_times'][frames], ref['step_sizes'][row], segments))
+
+    tasks = [songs[st:st+songs_per_task] for st in range(0, len(songs), songs_per_task)]
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_scoring,
+                             initargs=(tables,)) as executor:
+        return [result for results in executor.map(_score_songs, tasks) for result in results]
+
+
+#----------
+# Reports
+def song_report(results):
+    """ Per-song DataFrame: frames, accuracy, WCSR per metric """
+    df = pd.DataFrame(results).set_index('id')
+    df['accuracy'] = df['correct']/df['frames']
+    for metric in _WCSR_METRICS:
+        df[f'wcsr_{metric}'] = df[f'{metric}_score']/df[f'{metric}_duration']
+    return df
+
+def aggregate_report(df):
+    """ Frame-weighted accuracy and duration-weighted WCSR over all songs, and per-song means """
+    summary = {'songs': len(df), 'frames': int(df['frames'].sum()),
+               'accuracy': float(df['correct'].sum()/df['frames'].sum()),
+               'mean_song_accuracy': float(df['accuracy'].mean())}
+    for metric in _WCSR_METRICS:
+        summary[f'wcsr_{metric}'] = float(df[f'{metric}_score'].sum()
+                                          / df[f'{metric}_duration'].sum())
+        summary[f'mean_song_wcsr_{metric}'] = float(df[f'wcsr_{metric}'].mean())
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--ids', type=int, nargs='+', help='songs to evaluate (overrides --split)')
+    parser.add_argument('--split', default='test', choices=['test', 'val', 'all'])
+    parser.add_argument('--fold', type=int, default=0, help='CV fold of --split val')
+    parser.add_argument('--label-type', default='majmin', choices=list(_CLASSES),
+                        help='label type of the model outputs, for frame accuracy')
+    parser.add_argument('--backend', default='keras', choices=autochord._BACKENDS)
+    parser.add_argument('--model-dir', help='Keras checkpoint (default: autochord model)')
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--rebuild-reference', action='store_true')
+    parser.add_argument('--out-dir', default=os.path.join(_EVAL_DIR, 'report'))
+    parser.add_argument('--check-tables', action='store_true',
+                        help='only check the comparison tables of all label types, and exit')
+    parser.add_argument('--store-dir', default=dataloader._STORE_DIR,
+                        help='feature store of build_feature_store.py, used if built')
+    args = parser.parse_args()
+    dataloader.use_feature_store(args.store_dir)
+
+    if args.check_tables:
+        check_comparison_tables()
+        return
+
+    ids = args.ids or get_split_ids(args.split, fold=args.fold)
+    st = time.perf_counter()
+    ref = load_reference(ids, label_type=args.label_type, workers=args.workers,
+                         rebuild=args.rebuild_reference)
+    tables = comparison_tables(ref, _CLASSES[args.label_type])
+    ref_dur = time.perf_counter() - st
+
+    st = time.perf_counter()
+    pred_labels = predict_songs(make_predictor(args.backend, args.model_dir), ids)
+    pred_dur = time.perf_counter() - st
+
+    st = time.perf_counter()
+    df = song_report(score_songs(ids, pred_labels, ref, tables, workers=args.workers))
+    summary = aggregate_report(df)
+    score_dur = time.perf_counter() - st
+
+    os.makedirs(args.out_dir, exist_ok=True)
+    df.to_csv(os.path.join(args.out_dir, 'songs.csv'))
+    with open(os.path.join(args.out_dir, 'summary.json'), 'w') as f:
+        json.dump(summary, f, indent=2)
+
+    print(df[['frames', 'accuracy', *[f'wcsr_{m}' for m in _WCSR_METRICS]]]
+          .sort_values('accuracy').to_string(float_format='%.4f'))
+    print(json.dumps(summary, indent=2))
+    print(f'reference {ref_dur:.1f} s, inference {pred_dur:.1f} s, scoring {score_dur:.1f} s; '
+          f'reports in {args.out_dir}')
+
+
+if __name__ == '__main__':
+    main()
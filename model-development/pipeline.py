@@ -0,0 +1,166 @@
+"""
+tf.data input pipeline streaming chroma sequences from the shards of
+`build_dataset.py` (`dataloader.SequenceShards`), for training `ModelWithCRFLoss`
+without holding the training set in memory
+
+Report input throughput, run from `model-development`:
+    python pipeline.py --shard-dir data/chordseq/majmin_128 --steps 500 [--cache] [--transpose]
+"""
+import argparse
+import time
+
+import numpy as np
+import tensorflow as tf
+
+import dataloader
+from augment import make_tf_transpose, _LABEL_NUM_CLASSES
+
+
+_BATCH_SIZE = 64
+_SHUFFLE_BUFFER = 4096 # sequences
+_CYCLE_LENGTH = 8      # songs read concurrently
+
+
+def _song_records(shards, song_ids):
+    """
+    Per song: shard files, and bytes to skip before (header) and after (footer)
+    its sequences, such that each fixed-length record is one sequence
+    """
+    records = {'feats_fn': [], 'labels_fn': [], 'feats_header': [], 'feats_footer': [],
+               'labels_header': [], 'labels_footer': []}
+    for _id in song_ids:
+        row = shards.row_of_id[_id]
+        shard_ix, st, count = shards.shards[row], shards.offsets[row], shards.counts[row]
+        for name, arrs in [('feats', shards.feats), ('labels', shards.labels)]:
+            arr = arrs[shard_ix]
+            record_bytes = arr.itemsize*int(np.prod(arr.shape[1:]))
+            records[f'{name}_fn'].append(arr.filename)
+            records[f'{name}_header'].append(arr.offset + st*record_bytes)
+            records[f'{name}_footer'].append((len(arr)-st-count)*record_bytes)
+
+    return {name: np.array(values, dtype=np.int64 if 'fn' not in name else str)
+            for name, values in records.items()}
+
+
+def make_dataset(shard_dir, song_ids=None, batch_size=_BATCH_SIZE, shuffle=True,
+                 shuffle_buffer=_SHUFFLE_BUFFER, augment=None, cache=False,
+                 repeat=False, seed=dataloader._SEED, drop_remainder=False):
+    """
+    tf.data.Dataset of (feats, labels) batches of songs `song_ids` (default:
+    all) from shards in `shard_dir`, e.g. the train IDs of a CV fold.
+
+    Sequences are read straight from the shard files (songs interleaved, in
+    parallel), decoded, optionally cached (`cache`: True for memory, or a file
+    path), shuffled, batched, augmented with `augment(feats, labels)` on whole
+    batches as a parallel map (e.g. `augment.make_tf_transpose`), and
+    prefetched, so input overlaps with `train_step`. When cached, song order is
+    fixed after the first epoch, while sequences are still reshuffled.
+    """
+    shards = dataloader.SequenceShards(shard_dir)
+    song_ids = list(shards) if song_ids is None else list(song_ids)
+    seq_len = shards.meta['seq_len']
+    num_feats = len(dataloader._CHROMA_FEAT_NAMES)
+    feats_bytes = seq_len*num_feats*np.dtype(np.float32).itemsize
+    labels_bytes = seq_len*np.dtype(np.int32).itemsize
+
+    def read_song(record):
+        feats = tf.data.FixedLengthRecordDataset(record['feats_fn'], feats_bytes,
+                                                 header_bytes=record['feats_header'],
+                                                 footer_bytes=record['feats_footer'])
+        labels = tf.data.FixedLengthRecordDataset(record['labels_fn'], labels_bytes,
+                                                  header_bytes=record['labels_header'],
+                                                  footer_bytes=record['labels_footer'])
+        return tf.data.Dataset.zip((feats, labels))
+
+    def decode(feats, labels):
+        feats = tf.reshape(tf.io.decode_raw(feats, tf.float32), [seq_len, num_feats])
+        labels = tf.reshape(tf.io.decode_raw(labels, tf.int32), [seq_len])
+        return feats, labels
+
+    dataset = tf.data.Dataset.from_tensor_slices(_song_records(shards, song_ids))
+    if shuffle:
+        dataset = dataset.shuffle(len(song_ids), seed=seed, reshuffle_each_iteration=True)
+    dataset = dataset.interleave(read_song, cycle_length=_CYCLE_LENGTH,
+                                 num_parallel_calls=tf.data.AUTOTUNE, deterministic=not shuffle)
+    dataset = dataset.map(decode, num_parallel_calls=tf.data.AUTOTUNE)
+    if cache:
+        dataset = dataset.cache('' if cache is True else cache)
+    if shuffle:
+        dataset = dataset.shuffle(shuffle_buffer, seed=seed, reshuffle_each_iteration=True)
+    if repeat:
+        dataset = dataset.repeat()
+    dataset = dataset.batch(batch_size, drop_remainder=drop_remainder)
+    if augment is not None:
+        dataset = dataset.map(augment, num_parallel_calls=tf.data.AUTOTUNE,
+                              deterministic=not shuffle)
+
+    return dataset.prefetch(tf.data.AUTOTUNE)
+
+
+#----------
+# Throughput
+def measure_throughput(dataset, num_steps=None):
+    """ Batches/s and sequences/s of iterating `dataset` (input pipeline alone) """
+    num_batches, num_seqs = 0, 0
+    st = time.perf_counter()
+    for _, labels in dataset.take(-1 if num_steps is None else num_steps):
+        num_batches += 1
+        num_seqs += int(labels.shape[0])
+    dur = time.perf_counter() - st
+    return {'steps': num_batches, 'seconds': dur,
+            'steps_per_sec': num_batches/dur if dur > 0 else 0.0,
+            'seqs_per_sec': num_seqs/dur if dur > 0 else 0.0}
+
+
+class ThroughputCallback(tf.keras.callbacks.Callback):
+    """ Keras callback reporting training steps/s per epoch (added to logs as `steps_per_sec`) """
+
+    def __init__(self, verbose=True):
+        super().__init__()
+        self.verbose = verbose
+        self.history = []
+        self._st = None
+        self._num_steps = 0
+
+    def on_epoch_begin(self, epoch, logs=None):
+        self._num_steps = 0
+        self._st = time.perf_counter()
+
+    def on_train_batch_end(self, batch, logs=None):
+        self._num_steps += 1
+
+    def on_epoch_end(self, epoch, logs=None):
+        steps_per_sec = self._num_steps/(time.perf_counter() - self._st)
+        self.history.append(steps_per_sec)
+        if logs is not None:
+            logs['steps_per_sec'] = steps_per_sec
+        if self.verbose:
+            print(f'Epoch {epoch+1}: {steps_per_sec:.1f} steps/s')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--shard-dir', default=f'{dataloader._SEQ_DIR}/majmin_{dataloader._SEQ_LEN}')
+    parser.add_argument('--batch-size', type=int, default=_BATCH_SIZE)
+    parser.add_argument('--steps', type=int, default=500)
+    parser.add_argument('--epochs', type=int, default=2, help='passes, to see effect of --cache')
+    parser.add_argument('--cache', action='store_true', help='cache decoded shards in memory')
+    parser.add_argument('--transpose', action='store_true',
+                        help='random pitch-shift augmentation (chroma rotation)')
+    args = parser.parse_args()
+
+    augment = None
+    if args.transpose:
+        label_type = dataloader.SequenceShards(args.shard_dir).meta['label_type']
+        augment = make_tf_transpose(num_classes=_LABEL_NUM_CLASSES[label_type])
+    dataset = make_dataset(args.shard_dir, batch_size=args.batch_size, cache=args.cache,
+                           augment=augment)
+    for epoch in range(args.epochs):
+        stats = measure_throughput(dataset, args.steps)
+        print(f'Pass {epoch+1}: {stats["steps"]} steps in {stats["seconds"]:.2f} s, '
+              f'{stats["steps_per_sec"]:.1f} steps/s ({stats["seqs_per_sec"]:.0f} sequences/s)')
+
+
+if __name__ == '__main__':
+    main()
@@ -1,29 +1,38 @@
 """Main functions"""
 import os
+import threading
 from shutil import copy
-import pkg_resources
 
 import numpy as np
-from scipy.signal import resample
-import gdown
-import librosa
 import vamp
 import lazycats.np as catnp
-from tensorflow import keras
 
+# NOTE: heavy dependencies (TensorFlow, librosa, SciPy, gdown) are imported
+# on first use so that `import autochord` stays cheap
 
-_CHROMA_VAMP_LIB = pkg_resources.resource_filename('autochord', 'res/nnls-chroma.so')
+
+_CHROMA_VAMP_LIB = os.path.join(os.path.dirname(__file__), 'res', 'nnls-chroma.so')
 _CHROMA_VAMP_KEY = 'nnls-chroma:nnls-chroma'
+_CHROMA_VAMP_READY = False
 
 _CHORD_MODEL_URL = 'https://drive.google.com/uc?id=1XBn7FyYjF8Ff6EuC7PjwwPzFBLRXGP7n'
 _EXT_RES_DIR = os.path.join(os.path.expanduser('~'), '.autochord')
 _CHORD_MODEL_DIR = os.path.join(_EXT_RES_DIR, 'chroma-seq-bilstm-crf-v1')
 _CHORD_MODEL = None
+_COMPILED_MODEL = None
+_NUMPY_MODEL_FN = os.path.join(_EXT_RES_DIR, 'chroma-seq-bilstm-crf-v1.npz')
+_NUMPY_MODEL = None
+_BACKENDS = ('keras', 'numpy') # inference backends
+_EXTRACTORS = ('vamp', 'numpy') # chroma extractors
+_INIT_LOCK = threading.RLock()
 
 _SAMPLE_RATE = 44100            # operating sample rate for all audio
 _SEQ_LEN = 128                  # LSTM model sequence length
 _BATCH_SIZE = 128               # arbitrary inference batch size
-_STEP_SIZE = 2048/_SAMPLE_RATE  # chroma vectors step size
+_CHROMA_HOP = 2048              # chroma vectors step size, in samples
+_CHROMA_BLOCK = 16384           # NNLS-chroma analysis block size, in samples
+_STEP_SIZE = _CHROMA_HOP/_SAMPLE_RATE  # chroma vectors step size
+_CHROMA_NUM_FEATS = 24          # bass + treble chroma
 
 _CHROMA_NOTES = ['C','Db','D','Eb','E','F','Gb','G','Ab','A','Bb','B']
 _NO_CHORD = 'N'
@@ -55,6 +64,8 @@ def _setup_chroma_vamp():
           f'Try copying `{_CHROMA_VAMP_LIB}` in any of following directories: {vamp_paths}')
 
 def _download_model():
+    import gdown
+
     os.makedirs(_EXT_RES_DIR, exist_ok=True)
     model_zip = os.path.join(_EXT_RES_DIR, 'model.zip')
     gdown.download(_CHORD_MODEL_URL, model_zip, quiet=False)
@@ -67,6 +78,8 @@ def _download_model():
 
 def _load_model():
     global _CHORD_MODEL_DIR, _CHORD_MODEL
+    from tensorflow import keras
+
     try:
         if not os.path.exists(_CHORD_MODEL_DIR):
             _CHORD_MODEL_DIR = _download_model()
@@ -76,67 +89,251 @@ def _load_model():
     except Exception as e:
         raise Exception(f'autochord: Error in loading model: {e}')
 
-def _init_module():
+def _ensure_chroma_vamp():
+    global _CHROMA_VAMP_READY
+    if _CHROMA_VAMP_READY:
+        return
+
+    with _INIT_LOCK:
+        if not _CHROMA_VAMP_READY:
+            _setup_chroma_vamp()
+            _CHROMA_VAMP_READY = True
+
+def _get_model():
+    if _CHORD_MODEL is None:
+        with _INIT_LOCK:
+            if _CHORD_MODEL is None:
+                _load_model()
+
+    return _CHORD_MODEL
+
+def _load_numpy_model():
+    global _NUMPY_MODEL
+    from .numpy_model import NumpyChordModel
+
+    if not os.path.exists(_NUMPY_MODEL_FN):
+        print('autochord: NumPy model weights not found, exporting from TensorFlow model')
+        export_numpy_model(_NUMPY_MODEL_FN)
+
+    _NUMPY_MODEL = NumpyChordModel(_NUMPY_MODEL_FN)
+    print(f'autochord: Loaded NumPy model from {_NUMPY_MODEL_FN}')
+
+def _get_numpy_model():
+    if _NUMPY_MODEL is None:
+        with _INIT_LOCK:
+            if _NUMPY_MODEL is None:
+                _load_numpy_model()
+
+    return _NUMPY_MODEL
+
+def _load_compiled_model():
+    global _COMPILED_MODEL
+    from .compiled_model import CompiledChordModel
+
+    _COMPILED_MODEL = CompiledChordModel(_get_model())
+    print('autochord: Traced and warmed up model inference function')
+
+def _get_compiled_model():
+    if _COMPILED_MODEL is None:
+        with _INIT_LOCK:
+            if _COMPILED_MODEL is None:
+                _load_compiled_model()
+
+    return _COMPILED_MODEL
+
+def _check_backend(backend):
+    if backend not in _BACKENDS:
+        raise ValueError(f'autochord: Unknown backend `{backend}`, choose from {_BACKENDS}')
+
+def _check_extractor(extractor):
+    if extractor not in _EXTRACTORS:
+        raise ValueError(f'autochord: Unknown chroma extractor `{extractor}`, '
+                         f'choose from {_EXTRACTORS}')
+
+def export_numpy_model(npz_fn=_NUMPY_MODEL_FN):
+    """
+    Export weights of the TensorFlow chord model to `npz_fn` for the 'numpy'
+    backend. Only this step needs TensorFlow; it is done automatically on first
+    use of the 'numpy' backend if the file does not exist yet.
+    """
+    from .numpy_model import export_weights
+
+    os.makedirs(os.path.dirname(os.path.abspath(npz_fn)), exist_ok=True)
+    export_weights(_get_model(), npz_fn)
+    print(f'autochord: Exported NumPy model to {npz_fn}')
+    return npz_fn
+
+def init(backend='keras'):
+    """
+    Set up the NNLS-Chroma VAMP plugin and load the chord model of `backend`.
+    This is otherwise done on first use of `generate_chroma`/`predict_chord_labels`.
+    """
+    _check_backend(backend)
     print('autochord: Initializing...')
-    _setup_chroma_vamp()
-    _load_model()
+    _ensure_chroma_vamp()
+    if backend == 'numpy':
+        _get_numpy_model()
+    else:
+        _get_compiled_model()
 
-_init_module()
+def warmup(backend='keras'):
+    """ Initialize, then run a dummy prediction to pay model start-up costs upfront """
+    init(backend=backend)
+    predict_chord_labels(np.zeros((_SEQ_LEN, _CHROMA_NUM_FEATS), dtype=np.float32),
+                         backend=backend)
 
 
 #################
 # Core Functions
 #################
-def generate_chroma(audio_fn, rollon=1.0):
-    """ Generate chroma from raw audio using NNLS-chroma VAMP plugin """
+def generate_chroma(audio_fn, rollon=1.0, cache=None, resample_quality='default', stats=None,
+                    extractor='vamp'):
+    """
+    Generate chroma from raw audio using NNLS-chroma VAMP plugin. If a
+    `ChromaCache` is given through `cache`, extraction is skipped on a hit.
 
-    samples, fs = librosa.load(audio_fn, sr=None, mono=True)
-    if fs != _SAMPLE_RATE:
-        samples = resample(samples, num=int(len(samples)*_SAMPLE_RATE/fs))
+    resample_quality: speed/quality tradeoff when audio is not at `_SAMPLE_RATE`,
+        one of 'fast', 'default', 'best', 'fft' (see `autochord.resample`)
+    stats: `PipelineStats` to record decode/resample/chroma timings in
+    extractor: 'vamp' (NNLS-Chroma VAMP plugin) or 'numpy' (the same algorithm
+        in NumPy/SciPy, see `autochord.nnls_chroma`)
+    """
+    import librosa
 
-    out = vamp.collect(samples, _SAMPLE_RATE, 'nnls-chroma:nnls-chroma',
-                       output='bothchroma', parameters={'rollon': rollon})
+    _check_extractor(extractor)
+    if cache is not None:
+        cache_key = cache.key(audio_fn, rollon=rollon, resample=resample_quality,
+                              extractor=extractor)
+        chroma = cache.get(cache_key)
+        if chroma is not None:
+            return chroma
+
+    with _stage(stats, 'decode'):
+        samples, fs = librosa.load(audio_fn, sr=None, mono=True)
+    with _stage(stats, 'resample'):
+        samples = resample(samples, fs, quality=resample_quality)
+    with _stage(stats, 'chroma'):
+        chroma = _nnls_chroma(samples, rollon, extractor=extractor)
+    if stats is not None:
+        stats.set_frames(len(chroma), stages=('decode', 'resample', 'chroma'))
+
+    if cache is not None:
+        cache.put(cache_key, chroma)
 
-    chroma = out['matrix'][1]
     return chroma
 
-def predict_chord_labels(chroma_vectors):
-    """ Predict (numeric) chord labels from sequence of chroma vectors """
+def predict_chord_labels(chroma_vectors, backend='keras', hop=None, merge='crop', stats=None):
+    """
+    Predict (numeric) chord labels from sequence of chroma vectors
 
-    chordseq_vectors = catnp.divide_to_subsequences(chroma_vectors, sub_len=_SEQ_LEN)
-    pred_labels, _, _, _ = _CHORD_MODEL.predict(chordseq_vectors, batch_size=_BATCH_SIZE)
-    pred_labels = pred_labels.flatten()
-    if len(chroma_vectors) < len(pred_labels): # remove pad
-        pad_st = len(pred_labels)-_SEQ_LEN
-        pad_ed = pad_st+len(pred_labels)-len(chroma_vectors)
-        pred_labels = np.append(pred_labels[:pad_st], pred_labels[pad_ed:])
+    backend: 'keras' (TensorFlow model) or 'numpy' (same model on exported
+        weights, no TensorFlow needed once exported)
+    hop: if given, run the model on overlapping windows `hop` frames apart
+        instead of non-overlapping blocks, merging outputs by `merge`
+        (see `autochord.windowed.predict_chord_labels_windowed`)
+    stats: `PipelineStats` to record the predict timing in
+    """
 
-    assert len(pred_labels)==len(chroma_vectors)
-    return pred_labels
+    with _stage(stats, 'predict') as stage:
+        stage['frames'] = len(chroma_vectors)
+        if hop is not None:
+            return predict_chord_labels_windowed(chroma_vectors, hop=hop, merge=merge,
+                                                 backend=backend)
+
+        chordseq_vectors = _to_subsequences(chroma_vectors)
+        pred_labels = _predict_subsequences(chordseq_vectors, backend=backend)
+        return _from_subsequences(pred_labels, len(chroma_vectors))
 
-def recognize(audio_fn, lab_fn=None):
+def recognize(audio_fn, lab_fn=None, cache=None, backend='keras', hop=None, stats=None,
+              extractor='vamp'):
     """
     Perform chord recognition on provided audio file. Optionally,
-    you may dump the labels on a LAB file (MIREX format) through `lab_fn`.
+    you may dump the labels on a LAB file (MIREX format) through `lab_fn`,
+    and reuse previously extracted chroma through a `ChromaCache` in `cache`.
+    The inference backend ('keras' or 'numpy') is selected through `backend`,
+    the chroma extractor ('vamp' or 'numpy') through `extractor`, and
+    overlapping-window inference is enabled through `hop`. Pass a
+    `PipelineStats` as `stats` to time each stage.
     """
 
-    chroma_vectors = generate_chroma(audio_fn)
-    pred_labels = predict_chord_labels(chroma_vectors)
+    _check_backend(backend)
+    chroma_vectors = generate_chroma(audio_fn, cache=cache, stats=stats, extractor=extractor)
+    pred_labels = predict_chord_labels(chroma_vectors, backend=backend, hop=hop, stats=stats)
 
-    chord_labels = catnp.squash_consecutive_duplicates(pred_labels)
-    chord_lengths = [0] + list(catnp.contiguous_lengths(pred_labels))
-    chord_timestamps = np.cumsum(chord_lengths)
+    with _stage(stats, 'postprocess') as stage:
+        stage['frames'] = len(pred_labels)
+        out_labels = _to_chord_segments(pred_labels)
 
-    chord_labels = [_MAJMIN_CLASSES[label] for label in chord_labels]
-    out_labels = [(_STEP_SIZE*st, _STEP_SIZE*ed, chord_name)
-                  for st, ed, chord_name in 
-                  zip(chord_timestamps[:-1], chord_timestamps[1:], chord_labels)]
-
-    if lab_fn: # dump labels to file
-        str_labels = [f'{st}\t{ed}\t{chord_name}'
-                      for st, ed, chord_name in out_labels]
-        with open(lab_fn, 'w') as f:
-            for line in str_labels:
-                f.write("%s\n" % line)
+        if lab_fn: # dump labels to file
+            write_lab(lab_fn, out_labels)
 
     return out_labels
+
+
+##########
+# Helpers
+##########
+def _nnls_chroma(samples, rollon=1.0, extractor='vamp'):
+    """ Run NNLS-chroma VAMP plugin (or its NumPy version) on samples at `_SAMPLE_RATE` """
+    if extractor == 'numpy':
+        from .nnls_chroma import nnls_chroma
+        return nnls_chroma(samples, rollon)
+
+    _ensure_chroma_vamp()
+    out = vamp.collect(samples, _SAMPLE_RATE, _CHROMA_VAMP_KEY,
+                       output='bothchroma', parameters={'rollon': rollon})
+    return out['matrix'][1]
+
+def _to_subsequences(chroma_vectors):
+    """ Divide chroma vectors into model-sized subsequences (last one pre-padded) """
+    return catnp.divide_to_subsequences(chroma_vectors, sub_len=_SEQ_LEN)
+
+def _predict_subsequences(chordseq_vectors, backend='keras'):
+    """ Predict labels of a stack of subsequences, shape: (num_subseq, _SEQ_LEN) """
+    _check_backend(backend)
+    if backend == 'numpy':
+        return _get_numpy_model().predict(chordseq_vectors, batch_size=_BATCH_SIZE)
+
+    return _get_compiled_model().predict(chordseq_vectors)
+
+def _predict_potentials(chordseq_vectors, backend='keras'):
+    """
+    CRF unary potentials of a stack of subsequences, shape: (num_subseq, _SEQ_LEN,
+    num. classes), and the CRF transition matrix, shape: (num. classes, num. classes)
+    """
+    _check_backend(backend)
+    if backend == 'numpy':
+        numpy_model = _get_numpy_model()
+        return (numpy_model.predict_potentials(chordseq_vectors, batch_size=_BATCH_SIZE),
+                numpy_model.transitions)
+
+    compiled_model = _get_compiled_model()
+    return compiled_model.predict_potentials(chordseq_vectors), compiled_model.transitions
+
+def _from_subsequences(pred_labels, num_frames):
+    """ Flatten predicted subsequences back to `num_frames` labels """
+    pred_labels = pred_labels.flatten()
+    if num_frames < len(pred_labels): # remove pad
+        pad_st = len(pred_labels)-_SEQ_LEN
+        pad_ed = pad_st+len(pred_labels)-num_frames
+        pred_labels = np.append(pred_labels[:pad_st], pred_labels[pad_ed:])
+
+    assert len(pred_labels)==num_frames
+    return pred_labels
+
+def _to_chord_segments(pred_labels):
+    """ Convert frame-wise labels to (chord start, chord end, chord name) tuples """
+    return segments_to_tuples(*encode_segments(pred_labels))
+
+
+# pylint: disable=wrong-import-position
+from .batch import recognize_many, RecognitionResult
+from .cache import ChromaCache
+from .labels import (encode_segments, segments_to_tuples, write_lab, write_jsonl,
+                     write_segments, read_segments)
+from .resampling import resample
+from .windowed import WindowedLabeler, predict_chord_labels_windowed
+from .realtime import RealtimeRecognizer, ChordEvent, recognize_stream
+from .streaming import ChromaStream, generate_chroma_stream
+from .profiling import PipelineStats, StageTiming, _stage
+from .aio import recognize_async, recognize_many_async
@@ -0,0 +1,195 @@
+"""
+asyncio API: chord recognition without blocking the event loop, overlapping
+chroma extraction of upcoming files with inference on finished ones
+"""
+import os
+import asyncio
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from . import (generate_chroma, predict_chord_labels, _check_backend, _check_extractor,
+               _to_chord_segments)
+from .batch import SubsequencePacker, RecognitionResult, _finish
+from .labels import write_lab
+from .profiling import _stage
+
+
+_MODEL_EXECUTOR = None
+_MODEL_EXECUTOR_LOCK = threading.Lock()
+
+
+class _Done():
+    """ End of extracted files, with the error which ended them early if any """
+    def __init__(self, error=None):
+        self.error = error
+
+
+def _model_executor():
+    """ Single thread which runs all model calls, shared by all async callers """
+    global _MODEL_EXECUTOR
+    with _MODEL_EXECUTOR_LOCK:
+        if _MODEL_EXECUTOR is None:
+            _MODEL_EXECUTOR = ThreadPoolExecutor(max_workers=1,
+                                                 thread_name_prefix='autochord-model')
+    return _MODEL_EXECUTOR
+
+async def _aiter(audio_fns):
+    """ Iterate over an async or a regular iterable """
+    if hasattr(audio_fns, '__aiter__'):
+        async for audio_fn in audio_fns:
+            yield audio_fn
+    else:
+        for audio_fn in audio_fns:
+            yield audio_fn
+
+
+def _postprocess(pred_labels, lab_fn, stats):
+    """ Chord segments of frame labels, optionally dumped to `lab_fn` """
+    with _stage(stats, 'postprocess') as stage:
+        stage['frames'] = len(pred_labels)
+        out_labels = _to_chord_segments(pred_labels)
+
+        if lab_fn: # dump labels to file
+            write_lab(lab_fn, out_labels)
+
+    return out_labels
+
+async def recognize_async(audio_fn, lab_fn=None, cache=None, backend='keras', hop=None,
+                          executor=None, stats=None, extractor='vamp'):
+    """
+    Same as `autochord.recognize`, as a coroutine. Decoding and chroma
+    extraction run in `executor` (default: the event loop's), model inference
+    on a single thread shared by all async calls, so the event loop is free
+    and concurrent calls overlap extraction with inference.
+    """
+    _check_backend(backend)
+    _check_extractor(extractor)
+    loop = asyncio.get_running_loop()
+    chroma_vectors = await loop.run_in_executor(
+        executor, functools.partial(generate_chroma, audio_fn, cache=cache, stats=stats,
+                                    extractor=extractor))
+    pred_labels = await loop.run_in_executor(
+        _model_executor(), functools.partial(predict_chord_labels, chroma_vectors,
+                                             backend=backend, hop=hop, stats=stats))
+    return await loop.run_in_executor(executor, _postprocess, pred_labels, lab_fn, stats)
+
+
+def _label_songs(songs, lab_dir, backend, hop):
+    """ Label (audio_fn, chroma) of `songs`, batching their subsequences together """
+    try:
+        if hop is None:
+            packer = SubsequencePacker(backend=backend)
+            for audio_fn, chroma_vectors in songs:
+                packer.push(audio_fn, chroma_vectors)
+            labeled = packer.pop_ready(flush=True)
+        else:
+            labeled = [(audio_fn, predict_chord_labels(chroma_vectors, backend=backend, hop=hop))
+                       for audio_fn, chroma_vectors in songs]
+    except Exception as e:
+        return [RecognitionResult(audio_fn, None, e) for audio_fn, _ in songs]
+
+    return [_finish(audio_fn, pred_labels, lab_dir) for audio_fn, pred_labels in labeled]
+
+async def recognize_many_async(audio_fns, lab_dir=None, rollon=1.0, cache=None, backend='keras',
+                               hop=None, max_concurrency=None, max_queued=None, executor=None,
+                               extractor='vamp'):
+    """
+    Async iterator of `RecognitionResult(audio_fn, labels, error)` over many
+    audio files (a regular or async iterable), in completion order, e.g.
+
+        async for res in autochord.recognize_many_async(audio_fns, lab_dir='labs'):
+            ...
+
+    Up to `max_concurrency` files (default: CPU count) are decoded and their
+    chroma extracted in `executor` (default: a thread pool of that size; pass a
+    `ProcessPoolExecutor` for extraction in processes) while the model labels
+    files already extracted. Extracted chroma wait in a queue of at most
+    `max_queued` files (default: `max_concurrency`); when the model falls
+    behind, extraction pauses and no more files are taken from `audio_fns`, so
+    memory stays bounded. Files waiting in the queue are labeled together, with
+    subsequences packed into full batches. Chroma are extracted by `extractor`
+    ('vamp' or 'numpy').
+    """
+    _check_backend(backend)
+    _check_extractor(extractor)
+    if lab_dir:
+        os.makedirs(lab_dir, exist_ok=True)
+
+    loop = asyncio.get_running_loop()
+    max_concurrency = max_concurrency or os.cpu_count()
+    max_queued = max_queued or max_concurrency
+    own_executor = executor is None
+    if own_executor:
+        executor = ThreadPoolExecutor(max_workers=max_concurrency,
+                                      thread_name_prefix='autochord-extract')
+
+    queue = asyncio.Queue(maxsize=max_queued)
+    slots = asyncio.Semaphore(max_concurrency)
+
+    async def extract(audio_fn):
+        try:
+            try:
+                chroma_vectors = await loop.run_in_executor(
+                    executor, functools.partial(generate_chroma, audio_fn, rollon=rollon,
+                                                cache=cache, extractor=extractor))
+                item = (audio_fn, chroma_vectors, None)
+            except Exception as e:
+                item = (audio_fn, None, e)
+            await queue.put(item) # waits while the model is behind
+        finally:
+            slots.release()
+
+    async def produce():
+        tasks = set()
+        try:
+            async for audio_fn in _aiter(audio_fns):
+                await slots.acquire()
+                task = asyncio.ensure_future(extract(audio_fn))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+            await asyncio.gather(*tasks)
+        except asyncio.CancelledError:
+            for task in tasks:
+                task.cancel()
+            raise
+        except Exception as e: # e.g. from iterating `audio_fns`
+            for task in tasks:
+                task.cancel()
+            await queue.put(_Done(e))
+            return
+        await queue.put(_Done())
+
+    producer = asyncio.ensure_future(produce())
+    try:
+        done = None
+        while done is None:
+            items = [await queue.get()]
+            while not queue.empty():
+                items.append(queue.get_nowait())
+
+            songs = []
+            for item in items:
+                if isinstance(item, _Done):
+                    done = item
+                    continue
+
+                audio_fn, chroma_vectors, error = item
+                if error is not None:
+                    yield RecognitionResult(audio_fn, None, error)
+                else:
+                    songs.append((audio_fn, chroma_vectors))
+
+            if songs:
+                results = await loop.run_in_executor(
+                    _model_executor(), _label_songs, songs, lab_dir, backend, hop)
+                for result in results:
+                    yield result
+
+        if done.error is not None:
+            raise done.error
+    finally:
+        producer.cancel()
+        await asyncio.gather(producer, return_exceptions=True)
+        if own_executor:
+            executor.shutdown(wait=False)
@@ -0,0 +1,177 @@
+""" Batch chord recognition over many audio files """
+import os
+import multiprocessing
+from collections import deque, namedtuple
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+import numpy as np
+
+from . import (_BATCH_SIZE, _SEQ_LEN, _CHROMA_NUM_FEATS, generate_chroma,
+               _check_backend, _to_subsequences, _predict_subsequences, _from_subsequences,
+               _to_chord_segments)
+from .labels import write_lab
+
+
+RecognitionResult = namedtuple('RecognitionResult', ['audio_fn', 'labels', 'error'])
+
+
+class SubsequencePacker():
+    """
+    Packs model subsequences of many songs into full inference batches,
+    and hands back per-song labels once all of a song's subsequences are predicted
+    """
+
+    def __init__(self, batch_size=_BATCH_SIZE, backend='keras'):
+        self.batch_size = batch_size
+        self.backend = backend
+        self._songs = deque() # (key, num. frames, num. subsequences), in push order
+        self._pending = np.zeros((0, _SEQ_LEN, _CHROMA_NUM_FEATS), dtype=np.float32)
+        self._preds = np.zeros((0, _SEQ_LEN), dtype=np.int32)
+
+    def push(self, key, chroma_vectors):
+        """ Queue chroma vectors of a song for inference """
+        chordseq_vectors = _to_subsequences(chroma_vectors)
+        self._songs.append((key, len(chroma_vectors), len(chordseq_vectors)))
+        if len(chordseq_vectors) > 0:
+            self._pending = np.concatenate((self._pending, chordseq_vectors))
+
+    def __len__(self):
+        """ Number of songs not yet handed back """
+        return len(self._songs)
+
+    @property
+    def num_pending(self):
+        """ Number of subsequences waiting for inference """
+        return len(self._pending)
+
+    def _num_run(self, flush):
+        """ Number of pending subsequences `pop_ready(flush)` runs inference on """
+        if flush:
+            return len(self._pending)
+        return len(self._pending) - len(self._pending) % self.batch_size
+
+    def pop_ready(self, flush=False):
+        """
+        Run inference on all full batches (or on everything pending if `flush`),
+        and return (key, pred_labels) of songs which are now completely labeled
+        """
+        num_run = self._num_run(flush)
+        if num_run > 0:
+            pred_labels = _predict_subsequences(self._pending[:num_run],
+                                                backend=self.backend)
+            self._preds = np.concatenate((self._preds, pred_labels))
+            self._pending = self._pending[num_run:]
+
+        done = []
+        st = 0
+        while self._songs and (self._songs[0][2] <= len(self._preds)-st):
+            key, num_frames, num_subseq = self._songs.popleft()
+            ed = st+num_subseq
+            done.append((key, _from_subsequences(self._preds[st:ed], num_frames)))
+            st = ed
+
+        self._preds = self._preds[st:]
+        return done
+
+    def drop_batch(self, flush=False):
+        """
+        Drop songs with subsequences in what `pop_ready(flush)` would run
+        (e.g. after it failed), with all their subsequences; returns their keys
+        """
+        run_ed = len(self._preds) + self._num_run(flush)
+        dropped, kept = [], deque()
+        st = cut = 0
+        for key, num_frames, num_subseq in self._songs:
+            if (num_subseq > 0) and (st < run_ed):
+                dropped.append(key)
+                cut = st+num_subseq
+            else:
+                kept.append((key, num_frames, num_subseq))
+            st += num_subseq
+
+        self._songs = kept
+        self._pending = self._pending[max(0, cut-len(self._preds)):]
+        self._preds = self._preds[cut:]
+        return dropped
+
+
+def _lab_path(lab_dir, audio_fn):
+    lab_name = os.path.splitext(os.path.basename(audio_fn))[0] + '.lab'
+    return os.path.join(lab_dir, lab_name)
+
+def _finish(audio_fn, pred_labels, lab_dir):
+    try:
+        out_labels = _to_chord_segments(pred_labels)
+        if lab_dir:
+            write_lab(_lab_path(lab_dir, audio_fn), out_labels)
+    except Exception as e:
+        return RecognitionResult(audio_fn, None, e)
+
+    return RecognitionResult(audio_fn, out_labels, None)
+
+def _pop_results(packer, lab_dir, flush=False):
+    """ Results of songs labeled by `packer`; songs in a failed batch get its error """
+    try:
+        labeled = packer.pop_ready(flush=flush)
+    except Exception as e:
+        for audio_fn in packer.drop_batch(flush=flush):
+            yield RecognitionResult(audio_fn, None, e)
+        yield from _pop_results(packer, lab_dir, flush=flush)
+        return
+
+    for audio_fn, pred_labels in labeled:
+        yield _finish(audio_fn, pred_labels, lab_dir)
+
+def recognize_many(audio_fns, workers=None, lab_dir=None, rollon=1.0, max_pending=None,
+                   cache=None, backend='keras'):
+    """
+    Perform chord recognition on many audio files. Chroma extraction fans out
+    to a pool of `workers` processes, while model inference runs in this process
+    and packs subsequences from many songs into full batches of `_BATCH_SIZE`.
+
+    Yields a `RecognitionResult(audio_fn, labels, error)` per file as soon as
+    it is done, so results are NOT necessarily in input order. A file that fails
+    is reported through `error` instead of aborting the whole run; if model
+    inference fails, so are the files whose subsequences were in that batch.
+
+    lab_dir: if given, labels are also dumped to `<lab_dir>/<audio name>.lab`
+    max_pending: max. number of files being extracted at a time
+        (default: 2*workers), which bounds memory held by finished chroma
+    cache: `ChromaCache` shared by the workers; note that each worker counts
+        hits/misses on its own copy
+    backend: inference backend, 'keras' or 'numpy'
+    """
+    _check_backend(backend)
+    if lab_dir:
+        os.makedirs(lab_dir, exist_ok=True)
+
+    workers = workers or os.cpu_count()
+    max_pending = max_pending or 2*workers
+    audio_fns = iter(audio_fns)
+    packer = SubsequencePacker(backend=backend)
+
+    # spawn (not fork) since the parent may have TensorFlow loaded
+    mp_context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=workers, mp_context=mp_context) as executor:
+        running = {}
+        while True:
+            while len(running) < max_pending:
+                audio_fn = next(audio_fns, None)
+                if audio_fn is None:
+                    break
+                running[executor.submit(generate_chroma, audio_fn, rollon, cache)] = audio_fn
+
+            if not running:
+                break
+
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                audio_fn = running.pop(future)
+                try:
+                    packer.push(audio_fn, future.result())
+                except Exception as e:
+                    yield RecognitionResult(audio_fn, None, e)
+
+            yield from _pop_results(packer, lab_dir)
+
+    yield from _pop_results(packer, lab_dir, flush=True)
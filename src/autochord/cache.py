@@ -0,0 +1,116 @@
+""" On-disk cache for chroma features """
+import os
+import hashlib
+import tempfile
+
+import numpy as np
+
+from . import _EXT_RES_DIR, _SAMPLE_RATE
+
+
+_CHROMA_CACHE_DIR = os.path.join(_EXT_RES_DIR, 'chroma-cache')
+_CHROMA_CACHE_MAX_BYTES = 2*1024**3
+_HASH_CHUNK_SIZE = 1024**2
+
+
+class ChromaCache():
+    """
+    Content-addressed cache of chroma features. Entries are keyed by the hash
+    of the audio file contents plus the extraction parameters, stored as `.npy`
+    files and loaded back memory-mapped. Once the cache grows past `max_bytes`,
+    least recently used entries are evicted.
+
+    Pass an instance as `cache` to `generate_chroma`, `recognize`, etc.
+    """
+
+    def __init__(self, cache_dir=_CHROMA_CACHE_DIR, max_bytes=_CHROMA_CACHE_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(cache_dir, exist_ok=True)
+
+    @staticmethod
+    def key(audio_fn, rollon=1.0, sample_rate=_SAMPLE_RATE, **params):
+        """ Cache key of chroma extracted from `audio_fn` with given parameters """
+        content_hash = hashlib.sha256()
+        with open(audio_fn, 'rb') as f:
+            for chunk in iter(lambda: f.read(_HASH_CHUNK_SIZE), b''):
+                content_hash.update(chunk)
+
+        param_str = ','.join(f'{name}={value}' for name, value
+                             in sorted(dict(params, rollon=rollon, sr=sample_rate).items()))
+        return hashlib.sha256(f'{content_hash.hexdigest()}:{param_str}'.encode()).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, f'{key}.npy')
+
+    def get(self, key):
+        """ Return memory-mapped chroma stored under `key`, or None on a miss """
+        path = self._path(key)
+        try:
+            chroma = np.load(path, mmap_mode='r')
+            os.utime(path) # mark as recently used
+        except (FileNotFoundError, ValueError):
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        return chroma
+
+    def put(self, key, chroma):
+        """ Store chroma under `key`, evicting old entries if needed """
+        # write to temp file then rename, so concurrent readers never see partial files
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                np.save(f, np.asarray(chroma))
+            os.replace(tmp_path, self._path(key))
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+
+        self.evict(keep=key)
+
+    def evict(self, keep=None):
+        """ Remove least recently used entries until cache fits in `max_bytes` """
+        entries = []
+        for entry in os.scandir(self.cache_dir):
+            if entry.name.endswith('.npy') and (entry.name != f'{keep}.npy'):
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError: # removed by another process
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+
+        total_bytes = self.size_bytes()
+        for _, size, path in sorted(entries):
+            if total_bytes <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total_bytes -= size
+
+    def size_bytes(self):
+        """ Total size of cached entries """
+        total = 0
+        for entry in os.scandir(self.cache_dir):
+            if entry.name.endswith('.npy'):
+                try:
+                    total += entry.stat().st_size
+                except FileNotFoundError:
+                    continue
+        return total
+
+    def clear(self):
+        """ Remove all cached entries """
+        for entry in os.scandir(self.cache_dir):
+            if entry.name.endswith('.npy'):
+                os.remove(entry.path)
+
+    @property
+    def stats(self):
+        """ Hit/miss counters of this instance """
+        return {'hits': self.hits, 'misses': self.misses}
@@ -0,0 +1,65 @@
+"""
+Inference for the Keras chord model through a pre-traced `tf.function` with a
+fixed input shape, instead of `Model.predict` on every call
+"""
+import numpy as np
+
+from . import _BATCH_SIZE, _SEQ_LEN, _CHROMA_NUM_FEATS
+
+
+class CompiledChordModel():
+    """
+    Keras BiLSTM-CRF chord model behind one concrete function traced for
+    (`batch_size`, `_SEQ_LEN`, `_CHROMA_NUM_FEATS`) inputs. Subsequences are
+    run `batch_size` at a time, the last batch zero-padded, so there is no
+    per-call data adapter set-up and no retracing on odd batch sizes.
+
+    The function is traced and run once on construction. It only reads model
+    variables and keeps no state between calls, so it can be called from
+    several threads at once.
+    """
+
+    def __init__(self, model, batch_size=_BATCH_SIZE):
+        import tensorflow as tf
+
+        self.batch_size = batch_size
+        self.transitions = next(w.numpy() for w in model.weights if 'chain_kernel' in w.name)
+
+        input_spec = tf.TensorSpec([batch_size, _SEQ_LEN, _CHROMA_NUM_FEATS], tf.float32)
+
+        @tf.function(input_signature=[input_spec])
+        def infer(x):
+            labels, potentials, _, _ = model(x, training=False)
+            return labels, potentials
+
+        self._infer = infer.get_concrete_function()
+        self._infer(tf.zeros(input_spec.shape, input_spec.dtype)) # warm up
+
+    def _run(self, x):
+        """ (labels, potentials) of subsequences `x`, per batch """
+        x = np.asarray(x, dtype=np.float32)
+        for st in range(0, len(x), self.batch_size):
+            batch = x[st:st+self.batch_size]
+            num_seqs = len(batch)
+            if num_seqs < self.batch_size:
+                batch = np.concatenate(
+                    (batch, np.zeros((self.batch_size-num_seqs, *batch.shape[1:]), dtype=np.float32)))
+
+            labels, potentials = self._infer(batch)
+            yield labels.numpy()[:num_seqs], potentials.numpy()[:num_seqs]
+
+    def predict_potentials(self, x):
+        """ CRF unary potentials of subsequences `x`, shape: (batch, time, num. classes) """
+        potentials = [potentials for _, potentials in self._run(x)]
+        if not potentials:
+            return np.zeros((*np.shape(x)[:2], len(self.transitions)), dtype=np.float32)
+
+        return np.concatenate(potentials)
+
+    def predict(self, x):
+        """ Decoded (numeric) labels of subsequences `x`, shape: (batch, time) """
+        labels = [labels for labels, _ in self._run(x)]
+        if not labels:
+            return np.zeros(np.shape(x)[:2], dtype=np.int32)
+
+        return np.concatenate(labels)
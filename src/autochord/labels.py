@@ -0,0 +1,82 @@
+""" Chord segment encoding and bulk output writers (LAB, JSON Lines, binary) """
+import json
+
+import numpy as np
+
+from . import _STEP_SIZE, _MAJMIN_CLASSES
+
+
+def encode_segments(pred_labels, step_size=_STEP_SIZE):
+    """
+    Run-length encode frame-wise (numeric) labels into chord segments.
+    Returns arrays (starts, ends, labels), with times in seconds.
+    """
+    pred_labels = np.asarray(pred_labels)
+    if len(pred_labels) == 0:
+        return np.zeros(0), np.zeros(0), pred_labels
+
+    change_ixs = np.flatnonzero(pred_labels[1:] != pred_labels[:-1]) + 1
+    bounds = np.concatenate(([0], change_ixs, [len(pred_labels)]))
+    return step_size*bounds[:-1], step_size*bounds[1:], pred_labels[bounds[:-1]]
+
+def segments_to_tuples(starts, ends, labels, classes=_MAJMIN_CLASSES):
+    """ Segment arrays to a list of (chord start, chord end, chord name) """
+    names = np.asarray(classes)[np.asarray(labels, dtype=int)]
+    return list(zip(np.asarray(starts).tolist(), np.asarray(ends).tolist(), names.tolist()))
+
+
+#----------
+# Writers
+#----------
+def format_lab(segments):
+    """ (start, end, chord name) tuples as LAB (MIREX format) text """
+    if not segments:
+        return ''
+    return '\n'.join(map('{}\t{}\t{}'.format, *zip(*segments))) + '\n'
+
+def write_lab(lab_fn, segments):
+    """ Dump (start, end, chord name) tuples to a LAB file in a single write """
+    with open(lab_fn, 'w') as f:
+        f.write(format_lab(segments))
+
+def write_jsonl(fn, results):
+    """
+    Dump many songs' segments to a JSON Lines file in a single write, one
+    line per song: {"key": ..., "segments": [[start, end, chord name], ...]}
+
+    results: iterable of (key, segments), e.g. audio_fn and labels of `recognize`
+    """
+    lines = [json.dumps({'key': key, 'segments': segments}) for key, segments in results]
+    with open(fn, 'w') as f:
+        f.write('\n'.join(lines) + ('\n' if lines else ''))
+
+def write_segments(fn, results, classes=_MAJMIN_CLASSES):
+    """
+    Dump many songs' segments to a compact columnar binary file (`.npz`):
+    float64 start/end and uint8 label columns for all songs concatenated,
+    with per-song offsets. Read back with `read_segments`.
+
+    results: iterable of (key, (starts, ends, labels)) as from `encode_segments`
+    """
+    keys, starts, ends, labels = [], [], [], []
+    for key, (song_starts, song_ends, song_labels) in results:
+        keys.append(str(key))
+        starts.append(np.asarray(song_starts, dtype=np.float64))
+        ends.append(np.asarray(song_ends, dtype=np.float64))
+        labels.append(np.asarray(song_labels, dtype=np.uint8))
+
+    offsets = np.cumsum([0] + [len(song_labels) for song_labels in labels])
+    with open(fn, 'wb') as f:
+        np.savez(f, keys=np.array(keys, dtype=str), offsets=offsets,
+                 starts=np.concatenate(starts) if starts else np.zeros(0),
+                 ends=np.concatenate(ends) if ends else np.zeros(0),
+                 labels=np.concatenate(labels) if labels else np.zeros(0, dtype=np.uint8),
+                 classes=np.array(classes, dtype=str))
+
+def read_segments(fn):
+    """ Read file from `write_segments`, returns {key: list of (start, end, chord name)} """
+    with np.load(fn) as data:
+        offsets, classes = data['offsets'], data['classes']
+        starts, ends, labels = data['starts'], data['ends'], data['labels']
+        return {key: segments_to_tuples(starts[st:ed], ends[st:ed], labels[st:ed], classes)
+                for key, st, ed in zip(data['keys'].tolist(), offsets[:-1], offsets[1:])}
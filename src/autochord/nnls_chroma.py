@@ -0,0 +1,343 @@
+"""
+In-process NNLS chroma (Mauch & Dixon, 2010) in NumPy/SciPy, as an
+alternative to the NNLS-Chroma VAMP plugin for its 'bothchroma' output
+
+Same processing as the plugin, with all frames handled at once instead of one
+frame per plugin call:
+1. magnitude spectrum of Hann-windowed `_CHROMA_BLOCK`-sample frames every
+   `_CHROMA_HOP` samples (end zero-padded), with the 'rollon' low cut
+2. log-frequency spectrum, 3 bins per semitone from MIDI 20 to 105, through
+   a sparse cosine kernel over the linear frequency bins
+3. global tuning from the phase of the mean energy over the 3 bins of each
+   semitone, corrected by linear interpolation between bins
+4. spectral whitening by running mean and standard deviation
+5. note activations (84 semitones from A0) by non-negative least squares
+   against a dictionary of harmonic notes, solved for many frames together
+6. bass and treble chroma: activations weighted by the plugin's bass and
+   treble windows and folded into 12 bins from A
+"""
+import functools
+
+import numpy as np
+
+from . import _SAMPLE_RATE, _CHROMA_HOP, _CHROMA_BLOCK, _CHROMA_NUM_FEATS
+
+
+_BINS_PER_SEMITONE = 3
+_MIN_MIDI = 20                  # lowest log-frequency bin (one extra semitone below A0)
+_MAX_MIDI = 105                 # highest log-frequency bin (one extra semitone above A7)
+_NUM_BINS = (_MAX_MIDI - _MIN_MIDI)*_BINS_PER_SEMITONE + 1
+_NUM_NOTES = 84                 # note activations, from A0 (MIDI 21)
+_KERNEL_OVERSAMPLING = 80       # linear frequency oversampling of the log-frequency kernel
+_TUNING_BINS = 162              # lower log-frequency bins used for tuning estimation
+_WHITENING_LEN = 19             # running mean/std window, in log-frequency bins
+_NUM_HARMONICS = 20
+_HARMONIC_DECAY = 0.7           # amplitude of harmonic h: decay**(h-1)
+_MIN_PEAK_MAGNITUDE = 2.0       # frames with lower peak magnitude are silent
+_FRAMES_PER_CHUNK = 256         # frames transformed at a time, bounds memory
+
+# the plugin's `basswindow` and `treblewindow`: weights of the notes (from A0)
+# in the bass and treble chroma
+_BASS_WINDOW = np.array([
+    0.001769, 0.015848, 0.043608, 0.084265, 0.136670, 0.199341, 0.270509, 0.348162,
+    0.430105, 0.514023, 0.597545, 0.678311, 0.754038, 0.822586, 0.882019, 0.930656,
+    0.967124, 0.990393, 0.999803, 0.995091, 0.976388, 0.944223, 0.899505, 0.843498,
+    0.777785, 0.704222, 0.624888, 0.542025, 0.457975, 0.375112, 0.295778, 0.222215,
+    0.156502, 0.100495, 0.055777, 0.023612, 0.004909, 0.000000, 0.000000, 0.000000,
+    0.000000, 0.000000, 0.000000, 0.000000, 0.000000, 0.000000, 0.000000, 0.000000,
+    0.000000, 0.000000, 0.000000, 0.000000, 0.000000, 0.000000, 0.000000, 0.000000,
+    0.000000, 0.000000, 0.000000, 0.000000, 0.000000, 0.000000, 0.000000, 0.000000,
+    0.000000, 0.000000, 0.000000, 0.000000, 0.000000, 0.000000, 0.000000, 0.000000,
+    0.000000, 0.000000, 0.000000, 0.000000, 0.000000, 0.000000, 0.000000, 0.000000,
+    0.000000, 0.000000, 0.000000, 0.000000])
+_TREBLE_WINDOW = np.array([
+    0.000350, 0.003144, 0.008717, 0.017037, 0.028058, 0.041719, 0.057942, 0.076638,
+    0.097701, 0.121014, 0.146447, 0.173856, 0.203090, 0.233984, 0.266366, 0.300054,
+    0.334860, 0.370590, 0.407044, 0.444018, 0.481304, 0.518696, 0.555982, 0.592956,
+    0.629410, 0.665140, 0.699946, 0.733634, 0.766016, 0.796910, 0.826144, 0.853553,
+    0.878986, 0.902299, 0.923362, 0.942058, 0.958281, 0.971942, 0.982963, 0.991283,
+    0.996856, 0.999650, 0.999650, 0.996856, 0.991283, 0.982963, 0.971942, 0.958281,
+    0.942058, 0.923362, 0.902299, 0.878986, 0.853553, 0.826144, 0.796910, 0.766016,
+    0.733634, 0.699946, 0.665140, 0.629410, 0.592956, 0.555982, 0.518696, 0.481304,
+    0.444018, 0.407044, 0.370590, 0.334860, 0.300054, 0.266366, 0.233984, 0.203090,
+    0.173856, 0.146447, 0.121014, 0.097701, 0.076638, 0.057942, 0.041719, 0.028058,
+    0.017037, 0.008717, 0.003144, 0.000350])
+
+_NNLS_MAX_ITER = 500
+_NNLS_REFINE_EVERY = 10         # FISTA iterations between exact solves on the support
+_NNLS_TOL = 1e-6
+
+
+#------------------
+# Precomputed terms
+#------------------
+def _cospuls(x, centre, width):
+    """ Raised-cosine pulse of `width` around `centre` """
+    return np.where(np.abs(x - centre) <= 0.5*width,
+                    0.5*np.cos((x - centre)*2*np.pi/width) + 0.5, 0.0)
+
+def _bin_freqs():
+    """ Centre frequencies of the log-frequency bins """
+    midi = _MIN_MIDI + np.arange(_NUM_BINS)/_BINS_PER_SEMITONE
+    return 440*2**((midi - 69)/12)
+
+@functools.lru_cache(maxsize=None)
+def log_freq_kernel(block_size=_CHROMA_BLOCK, fs=_SAMPLE_RATE):
+    """
+    Sparse (`_NUM_BINS`, `block_size`//2) map from a magnitude spectrum to the
+    log-frequency spectrum: each linear bin is a cosine pulse two bins wide,
+    each log-frequency bin a cosine pulse two thirds of a semitone wide scaled
+    for bin density, integrated over an oversampled frequency axis
+    """
+    from scipy.sparse import coo_matrix
+
+    num_fft = block_size//2
+    df = fs/block_size
+    df_over = df/_KERNEL_OVERSAMPLING
+    bins_per_octave = 12*_BINS_PER_SEMITONE
+    fft_activation = _cospuls(np.arange(2*_KERNEL_OVERSAMPLING)*df_over, df, 2*df)
+
+    rows, cols, vals = [], [], []
+    for ix, centre in enumerate(_bin_freqs()):
+        # oversampled frequencies within the pulse of this log-frequency bin
+        os_st = max(1, int(np.floor(centre*2**(-1/bins_per_octave)/df_over)))
+        os_ed = int(np.ceil(centre*2**(1/bins_per_octave)/df_over)) + 1
+        os_ixs = np.arange(os_st, os_ed)
+        f = os_ixs*df_over
+        warped = bins_per_octave*(np.log2(f) - np.log2(centre))
+        activation = _cospuls(warped, 0.0, 2.0)/(np.log(2)/bins_per_octave*f)
+
+        # each oversampled frequency falls within the pulses of two linear bins
+        for offset in (0, 1):
+            fft_ixs = os_ixs//_KERNEL_OVERSAMPLING + offset
+            weights = activation*fft_activation[os_ixs - _KERNEL_OVERSAMPLING*(fft_ixs - 1)]
+            valid = (fft_ixs >= 1) & (fft_ixs < num_fft)
+            kernel_row = np.bincount(fft_ixs[valid], weights[valid], minlength=num_fft)
+            nonzero = np.flatnonzero(kernel_row > 0)
+            rows.append(np.full(len(nonzero), ix))
+            cols.append(nonzero)
+            vals.append(kernel_row[nonzero])
+
+    kernel = coo_matrix((np.concatenate(vals), (np.concatenate(rows), np.concatenate(cols))),
+                        shape=(_NUM_BINS, num_fft))
+    return kernel.tocsr()
+
+@functools.lru_cache(maxsize=None)
+def note_dictionary(decay=_HARMONIC_DECAY):
+    """
+    (`_NUM_BINS`, `_NUM_NOTES`) log-frequency spectra of notes from A0, each
+    with `_NUM_HARMONICS` harmonics of amplitude `decay`**(h-1)
+    """
+    bin_ixs = np.arange(_NUM_BINS)[:, np.newaxis]
+    dictionary = np.zeros((_NUM_BINS, _NUM_NOTES))
+    for harmonic in range(1, _NUM_HARMONICS+1):
+        centres = (_BINS_PER_SEMITONE*(np.arange(_NUM_NOTES) + 1)
+                   + _BINS_PER_SEMITONE*12*np.log2(harmonic))
+        near = np.abs(bin_ixs - centres) < 2
+        dictionary += near*_cospuls(bin_ixs, centres, _BINS_PER_SEMITONE)*decay**(harmonic-1)
+    return dictionary
+
+@functools.lru_cache(maxsize=None)
+def _running_mean_operator():
+    """
+    (`_NUM_BINS`, `_NUM_BINS`) running weighted mean over a normalized Hamming
+    window, replicating the first/last full-window value towards the edges
+    """
+    window = np.hamming(_WHITENING_LEN)
+    window /= window.sum()
+    half = _WHITENING_LEN//2
+    operator = np.zeros((_NUM_BINS, _NUM_BINS))
+    for ix in range(_NUM_BINS):
+        centre = min(max(ix, half), _NUM_BINS - half - 1)
+        operator[ix, centre-half:centre+half+1] = window
+    return operator
+
+@functools.lru_cache(maxsize=None)
+def chroma_profiles():
+    """ (`_NUM_NOTES`, 24) map from note activations to bass + treble chroma (from A) """
+    fold = np.zeros((_NUM_NOTES, 12))
+    fold[np.arange(_NUM_NOTES), np.arange(_NUM_NOTES) % 12] = 1
+    return np.concatenate([fold*_BASS_WINDOW[:, np.newaxis],
+                           fold*_TREBLE_WINDOW[:, np.newaxis]], axis=1)
+
+
+#-------------------------
+# Log-frequency spectrum
+#-------------------------
+def _frames(samples):
+    """ (num. frames, `_CHROMA_BLOCK`) view of frames every `_CHROMA_HOP` samples """
+    num_frames = -(-len(samples)//_CHROMA_HOP)
+    padded = np.zeros((num_frames-1)*_CHROMA_HOP + _CHROMA_BLOCK, dtype=np.float32)
+    padded[:len(samples)] = samples
+    return np.lib.stride_tricks.sliding_window_view(padded, _CHROMA_BLOCK)[::_CHROMA_HOP]
+
+def _rollon_cut(magnitude, rollon):
+    """ Zero the lowest bins holding `rollon` percent of each frame's energy (in place) """
+    energy = magnitude**2
+    threshold = energy.sum(axis=1, keepdims=True)*rollon/100
+    # bin i is zeroed while the energy from bin 2 up to bin i+2 is below threshold
+    below = np.cumsum(energy[:, 2:], axis=1) < threshold
+    num_cut = np.argmin(below, axis=1)
+    num_cut[below.all(axis=1)] = below.shape[1]
+    magnitude[np.arange(magnitude.shape[1]) < num_cut[:, np.newaxis]] = 0
+
+def log_freq_spectrum(samples, rollon=1.0):
+    """ (num. frames, `_NUM_BINS`) untuned log-frequency spectrum of samples at `_SAMPLE_RATE` """
+    samples = np.asarray(samples, dtype=np.float32)
+    if len(samples) == 0:
+        return np.zeros((0, _NUM_BINS))
+
+    from scipy.fft import rfft
+
+    frames = _frames(samples)
+    window = np.hanning(_CHROMA_BLOCK + 1)[:-1].astype(np.float32) # periodic
+    kernel = log_freq_kernel()
+    spectrum = np.empty((len(frames), _NUM_BINS))
+    for st in range(0, len(frames), _FRAMES_PER_CHUNK):
+        chunk = frames[st:st+_FRAMES_PER_CHUNK]*window
+        magnitude = np.abs(rfft(chunk, axis=1)[:, :_CHROMA_BLOCK//2])
+        np.minimum(magnitude, _CHROMA_BLOCK, out=magnitude)
+        if rollon > 0:
+            _rollon_cut(magnitude, rollon)
+        magnitude[magnitude.max(axis=1) < _MIN_PEAK_MAGNITUDE] = 0
+        spectrum[st:st+len(chunk)] = (kernel @ magnitude.T).T
+    return spectrum
+
+def estimate_tuning(spectrum):
+    """ Global tuning of a log-frequency spectrum, in semitones within (-0.5, 0.5] """
+    if len(spectrum) == 0:
+        return 0.0
+
+    energy = spectrum[:, :_TUNING_BINS].reshape(len(spectrum), -1, _BINS_PER_SEMITONE)
+    energy = energy.sum(axis=1).mean(axis=0)
+    phases = np.exp(2j*np.pi*np.arange(_BINS_PER_SEMITONE)/_BINS_PER_SEMITONE)
+    return float(np.angle(energy @ phases)/(2*np.pi))
+
+def tune_spectrum(spectrum, tuning):
+    """ Shift log-frequency spectrum by `tuning` semitones, interpolating between bins """
+    shift = tuning*_BINS_PER_SEMITONE
+    int_shift = int(np.floor(shift))
+    frac_shift = shift - int_shift
+    tuned = np.zeros_like(spectrum)
+    ixs = np.arange(2, _NUM_BINS-3)
+    tuned[:, ixs] = (spectrum[:, ixs+int_shift]*(1-frac_shift)
+                     + spectrum[:, ixs+int_shift+1]*frac_shift)
+    return tuned
+
+def whiten_spectrum(spectrum):
+    """ Subtract running mean, divide by running std, keep positive part """
+    operator_t = _running_mean_operator().T
+    running_mean = spectrum @ operator_t
+    running_std = np.sqrt(((spectrum - running_mean)**2) @ operator_t)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        whitened = np.where(spectrum > running_mean,
+                            (spectrum - running_mean)/running_std, 0.0)
+    return np.where(running_std > 0, whitened, spectrum)
+
+
+#------
+# NNLS
+#------
+def _kkt_ok(x, grad, mask, tol):
+    """ Rows of `x` satisfying NNLS optimality: zero gradient on support, non-negative off it """
+    scale = tol*np.maximum(np.abs(grad).max(axis=1, initial=0), 1.0)[:, np.newaxis]
+    on = x > 0
+    ok = np.where(on, np.abs(grad) <= scale, (grad >= -scale) | ~mask)
+    return ok.all(axis=1) & (x >= 0).all(axis=1)
+
+def _solve_on_support(gram, corr, support):
+    """ Least squares restricted to each row's support: gram[S, S] x[S] = corr[S] """
+    num_rows, num_atoms = support.shape
+    size = support.sum(axis=1).max(initial=0)
+    x = np.zeros((num_rows, num_atoms))
+    if size == 0:
+        return x
+
+    # support atoms of each row first, then (unused) padding atoms
+    order = np.argsort(~support, axis=1, kind='stable')[:, :size]
+    used = np.take_along_axis(support, order, axis=1)
+    system = gram[order[:, :, np.newaxis], order[:, np.newaxis, :]]
+    system *= used[:, :, np.newaxis] & used[:, np.newaxis, :]
+    system[:, np.arange(size), np.arange(size)] += ~used
+    rhs = np.take_along_axis(corr, order, axis=1)*used
+    solution = np.linalg.solve(system, rhs[:, :, np.newaxis])[:, :, 0]
+    np.put_along_axis(x, order, solution*used, axis=1)
+    return x
+
+def nnls_batch(dictionary, targets, mask=None, max_iter=_NNLS_MAX_ITER, tol=_NNLS_TOL):
+    """
+    Solve min ||dictionary @ x - b|| s.t. x >= 0 for each row b of `targets`,
+    (num. rows, num. atoms) solutions. Atoms where `mask` (num. rows, num.
+    atoms) is False are fixed at 0.
+
+    All rows are iterated together by accelerated projected gradient (FISTA)
+    on the Gram matrix. Every few iterations, the support of each row is
+    refined by an exact least squares solve, and rows whose refined solution
+    is optimal are done. Rows left after `max_iter` iterations are passed to
+    `scipy.optimize.nnls` one by one.
+    """
+    dictionary = np.asarray(dictionary, dtype=np.float64)
+    targets = np.asarray(targets, dtype=np.float64)
+    num_atoms = dictionary.shape[1]
+    if mask is None:
+        mask = np.ones((len(targets), num_atoms), dtype=bool)
+
+    gram = dictionary.T @ dictionary
+    step = 1/np.linalg.eigvalsh(gram)[-1]
+    x = np.zeros((len(targets), num_atoms))
+
+    # state of pending rows
+    rows = np.arange(len(targets))
+    corr = (targets @ dictionary)*mask
+    pending_mask = mask
+    x_pending = y = np.zeros_like(corr)
+    t = 1.0
+    for it in range(1, max_iter+1):
+        if len(rows) == 0:
+            break
+
+        x_next = np.maximum(y - (y @ gram - corr)*step, 0)*pending_mask
+        t_next = (1 + np.sqrt(1 + 4*t*t))/2
+        y = x_next + (x_next - x_pending)*((t - 1)/t_next)
+        x_pending, t = x_next, t_next
+
+        if it % _NNLS_REFINE_EVERY == 0:
+            refined = _solve_on_support(gram, corr, x_pending > 0)
+            done = _kkt_ok(refined, refined @ gram - corr, pending_mask, tol)
+            x[rows[done]] = refined[done]
+            rows, corr, pending_mask = rows[~done], corr[~done], pending_mask[~done]
+            x_pending, y = x_pending[~done], y[~done]
+
+    if len(rows) > 0:
+        from scipy.optimize import nnls
+        for ix in rows:
+            atoms = np.flatnonzero(mask[ix])
+            if len(atoms) > 0:
+                x[ix, atoms] = nnls(dictionary[:, atoms], targets[ix])[0]
+    return x
+
+
+#--------
+# Chroma
+#--------
+def note_activations(spectrum):
+    """ (num. frames, `_NUM_NOTES`) note activations of a whitened log-frequency spectrum """
+    # notes without energy in their 3 bins are left out of the solve
+    centres = _BINS_PER_SEMITONE//2 + 2 + _BINS_PER_SEMITONE*np.arange(_NUM_NOTES)
+    note_energy = sum(spectrum[:, centres + offset] for offset in (-1, 0, 1))
+    return nnls_batch(note_dictionary(), spectrum, mask=note_energy > 0)
+
+def nnls_chroma(samples, rollon=1.0, tuning=None):
+    """
+    (num. frames, 24) bass + treble chroma of samples at `_SAMPLE_RATE`, like
+    the NNLS-Chroma VAMP plugin's 'bothchroma' output. Tuning (in semitones)
+    is estimated over all samples unless given.
+    """
+    spectrum = log_freq_spectrum(samples, rollon)
+    if tuning is None:
+        tuning = estimate_tuning(spectrum)
+    spectrum = whiten_spectrum(tune_spectrum(spectrum, tuning))
+    if len(spectrum) == 0:
+        return np.zeros((0, _CHROMA_NUM_FEATS), dtype=np.float32)
+
+    return (note_activations(spectrum) @ chroma_profiles()).astype(np.float32)
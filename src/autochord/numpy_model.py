@@ -0,0 +1,159 @@
+"""
+NumPy-only inference for the BiLSTM-CRF chord model, so serving does not
+need TensorFlow once weights are exported
+"""
+import numpy as np
+
+from . import _BATCH_SIZE
+
+
+def _sigmoid(x):
+    return 0.5*(np.tanh(0.5*x) + 1.0) # overflow-free
+
+
+#----------
+# Export
+#----------
+def _crf_weights(layer):
+    weights = {w.name.split('/')[-1].split(':')[0]: w.numpy() for w in layer.weights}
+    if 'chain_kernel' not in weights:
+        return None
+
+    num_class = weights['chain_kernel'].shape[0]
+    return {
+        'crf/kernel': weights['kernel'],
+        'crf/bias': weights.get('bias', np.zeros(num_class)),
+        'crf/chain_kernel': weights['chain_kernel'],
+        'crf/left_boundary': weights.get('left_boundary', np.zeros(num_class)),
+        'crf/right_boundary': weights.get('right_boundary', np.zeros(num_class)),
+    }
+
+def _lstm_weights(lstm_layer, prefix):
+    if (lstm_layer.activation.__name__ != 'tanh') or \
+       (lstm_layer.recurrent_activation.__name__ != 'sigmoid'):
+        raise ValueError('autochord: Only tanh/sigmoid LSTM activations are supported')
+
+    kernel, recurrent_kernel, bias = lstm_layer.get_weights()
+    return {f'{prefix}/kernel': kernel,
+            f'{prefix}/recurrent_kernel': recurrent_kernel,
+            f'{prefix}/bias': bias}
+
+def export_weights(model, npz_fn):
+    """
+    Export weights of a (Keras) Bidirectional(LSTM) + CRF chord model,
+    as trained in `model-development`, to a NumPy `.npz` file
+    """
+    base_model = getattr(model, 'base_model', model)
+    weights = {}
+    for layer in base_model.layers:
+        class_name = layer.__class__.__name__
+        if class_name in ('InputLayer', 'Dropout'):
+            continue
+
+        if class_name == 'Bidirectional':
+            if layer.merge_mode != 'concat':
+                raise ValueError('autochord: Only `concat` merge mode is supported')
+            weights.update(_lstm_weights(layer.forward_layer, 'lstm_fw'))
+            weights.update(_lstm_weights(layer.backward_layer, 'lstm_bw'))
+            continue
+
+        crf_weights = _crf_weights(layer)
+        if crf_weights is None:
+            raise ValueError(f'autochord: Unsupported layer for NumPy export: '
+                             f'{layer.name} ({class_name})')
+        weights.update(crf_weights)
+
+    if ('lstm_fw/kernel' not in weights) or ('crf/chain_kernel' not in weights):
+        raise ValueError('autochord: Expected a Bidirectional(LSTM) + CRF model')
+
+    np.savez(npz_fn, **{name: w.astype(np.float32) for name, w in weights.items()})
+
+
+#----------
+# Inference
+#----------
+def lstm_forward(x, kernel, recurrent_kernel, bias, reverse=False):
+    """ Batched Keras-equivalent LSTM over `x` (batch, time, feats), returns all hidden states """
+    num_units = recurrent_kernel.shape[0]
+    batch_size, seq_len, _ = x.shape
+
+    # input projections of all time steps at once
+    x_proj = x @ kernel + bias
+    h = np.zeros((batch_size, num_units), dtype=x_proj.dtype)
+    c = np.zeros((batch_size, num_units), dtype=x_proj.dtype)
+    out = np.empty((batch_size, seq_len, num_units), dtype=x_proj.dtype)
+
+    steps = range(seq_len-1, -1, -1) if reverse else range(seq_len)
+    for t in steps:
+        z = x_proj[:, t] + h @ recurrent_kernel
+        z_i, z_f, z_c, z_o = np.split(z, 4, axis=1)
+        c = _sigmoid(z_f)*c + _sigmoid(z_i)*np.tanh(z_c)
+        h = _sigmoid(z_o)*np.tanh(c)
+        out[:, t] = h
+
+    return out
+
+def viterbi_decode(potentials, transitions):
+    """
+    Batched Viterbi decoding, equivalent to `tfa.text.crf_decode` over full-length
+    sequences. potentials: (batch, time, num_class), transitions: (num_class, num_class)
+    """
+    batch_size, seq_len, _ = potentials.shape
+    score = potentials[:, 0]
+    backpointers = np.empty((batch_size, max(seq_len-1, 0), potentials.shape[2]), dtype=np.int32)
+    for t in range(1, seq_len):
+        # (batch, from class, to class)
+        cand = score[:, :, np.newaxis] + transitions[np.newaxis]
+        backpointers[:, t-1] = np.argmax(cand, axis=1)
+        score = np.max(cand, axis=1) + potentials[:, t]
+
+    labels = np.empty((batch_size, seq_len), dtype=np.int32)
+    labels[:, -1] = np.argmax(score, axis=1)
+    batch_ixs = np.arange(batch_size)
+    for t in range(seq_len-2, -1, -1):
+        labels[:, t] = backpointers[batch_ixs, t, labels[:, t+1]]
+
+    return labels
+
+
+class NumpyChordModel():
+    """ BiLSTM-CRF chord model running on exported weights (see `export_weights`) """
+
+    def __init__(self, npz_fn):
+        with np.load(npz_fn) as weights:
+            self.weights = dict(weights)
+
+    @property
+    def transitions(self):
+        return self.weights['crf/chain_kernel']
+
+    def potentials(self, x):
+        """ CRF unary potentials of subsequences `x` (batch, time, feats) """
+        w = self.weights
+        x = np.asarray(x, dtype=np.float32)
+        lstm_out = np.concatenate((
+            lstm_forward(x, w['lstm_fw/kernel'], w['lstm_fw/recurrent_kernel'], w['lstm_fw/bias']),
+            lstm_forward(x, w['lstm_bw/kernel'], w['lstm_bw/recurrent_kernel'], w['lstm_bw/bias'],
+                         reverse=True)), axis=-1)
+
+        potentials = lstm_out @ w['crf/kernel'] + w['crf/bias']
+        potentials[:, 0] += w['crf/left_boundary']
+        potentials[:, -1] += w['crf/right_boundary']
+        return potentials
+
+    def predict_potentials(self, x, batch_size=_BATCH_SIZE):
+        """ CRF unary potentials of subsequences `x`, computed `batch_size` at a time """
+        potentials = [self.potentials(x[st:st+batch_size]) for st in range(0, len(x), batch_size)]
+        if not potentials:
+            return np.zeros((*np.shape(x)[:2], len(self.transitions)), dtype=np.float32)
+
+        return np.concatenate(potentials)
+
+    def predict(self, x, batch_size=_BATCH_SIZE):
+        """ Decoded (numeric) labels of subsequences `x`, shape: (batch, time) """
+        labels = [viterbi_decode(self.potentials(x[st:st+batch_size]), self.transitions)
+                  for st in range(0, len(x), batch_size)]
+        if not labels:
+            return np.zeros(np.shape(x)[:2], dtype=np.int32)
+
+        return np.concatenate(labels)
@@ -0,0 +1,118 @@
+""" Per-stage timing of the recognition pipeline """
+import time
+import tracemalloc
+from collections import namedtuple
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError: # not available on Windows
+    resource = None
+
+
+_STAGES = ('decode', 'resample', 'chroma', 'predict', 'postprocess')
+
+StageTiming = namedtuple('StageTiming', ['stage', 'wall', 'cpu', 'frames', 'peak_mem'])
+
+
+class PipelineStats():
+    """
+    Collects wall and CPU time of each pipeline stage (decode, resample,
+    chroma, predict, postprocess) over one or more runs. Pass an instance as
+    `stats` to `recognize`, `generate_chroma` or `predict_chord_labels`.
+
+    frames: chroma frames handled by the stage, giving frames/s per stage
+    peak_mem: with `track_memory`, peak bytes allocated during the stage as seen
+        by `tracemalloc` (NumPy arrays included; allocations inside the VAMP
+        plugin or TensorFlow are not). Slows down the run. Before Python 3.9, if
+        `tracemalloc` was already tracing, this is the peak since tracing began.
+    on_stage: optional callback, called with a `StageTiming` as each stage ends
+    """
+
+    def __init__(self, track_memory=False, on_stage=None):
+        self.track_memory = track_memory
+        self.on_stage = on_stage
+        self.timings = []
+
+    @contextmanager
+    def stage(self, name):
+        """ Time the enclosed block as stage `name`; set 'frames' in the yielded dict """
+        info = {'frames': 0}
+        tracing = self.track_memory and not tracemalloc.is_tracing()
+        if tracing:
+            tracemalloc.start()
+        elif self.track_memory and hasattr(tracemalloc, 'reset_peak'): # Python 3.9+
+            tracemalloc.reset_peak()
+
+        wall_st, cpu_st = time.perf_counter(), time.process_time()
+        try:
+            yield info
+        finally:
+            wall, cpu = time.perf_counter()-wall_st, time.process_time()-cpu_st
+            peak_mem = None
+            if self.track_memory:
+                peak_mem = tracemalloc.get_traced_memory()[1]
+                if tracing:
+                    tracemalloc.stop()
+
+            timing = StageTiming(name, wall, cpu, info['frames'], peak_mem)
+            self.timings.append(timing)
+            if self.on_stage is not None:
+                self.on_stage(timing)
+
+    def set_frames(self, frames, stages=_STAGES):
+        """ Set frame count of the latest timing of each of `stages` which has none yet """
+        pending = set(stages)
+        for ix in range(len(self.timings)-1, -1, -1):
+            timing = self.timings[ix]
+            if timing.stage in pending:
+                pending.remove(timing.stage)
+                if timing.frames == 0:
+                    self.timings[ix] = timing._replace(frames=frames)
+
+    def summary(self):
+        """ {stage: totals of wall, CPU time, frames, frames/s, max. peak memory, calls} """
+        summary = {}
+        for timing in self.timings:
+            stage = summary.setdefault(timing.stage, {'calls': 0, 'wall': 0.0, 'cpu': 0.0,
+                                                      'frames': 0, 'peak_mem': None})
+            stage['calls'] += 1
+            stage['wall'] += timing.wall
+            stage['cpu'] += timing.cpu
+            stage['frames'] += timing.frames
+            if timing.peak_mem is not None:
+                stage['peak_mem'] = max(stage['peak_mem'] or 0, timing.peak_mem)
+
+        for stage in summary.values():
+            stage['fps'] = stage['frames']/stage['wall'] if stage['wall'] > 0 else None
+        return summary
+
+    @staticmethod
+    def max_rss():
+        """ Process-wide peak resident memory in bytes, native allocations included """
+        if resource is None:
+            return None
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss*1024 # KiB on Linux
+
+    def reset(self):
+        self.timings = []
+
+    def __str__(self):
+        lines = [f'{"stage":>12s} {"calls":>5s} {"wall(s)":>8s} {"cpu(s)":>8s} {"frames/s":>10s}'
+                 + (f' {"peak(MiB)":>9s}' if self.track_memory else '')]
+        for name, stage in self.summary().items():
+            fps = f'{stage["fps"]:10.0f}' if stage['fps'] else f'{"-":>10s}'
+            line = f'{name:>12s} {stage["calls"]:5d} {stage["wall"]:8.3f} {stage["cpu"]:8.3f} {fps}'
+            if self.track_memory:
+                line += f' {(stage["peak_mem"] or 0)/2**20:9.1f}'
+            lines.append(line)
+        return '\n'.join(lines)
+
+
+@contextmanager
+def _no_stage():
+    yield {'frames': 0}
+
+def _stage(stats, name):
+    """ `stats.stage(name)`, or a no-op if no stats are collected """
+    return _no_stage() if stats is None else stats.stage(name)
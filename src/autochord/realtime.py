@@ -0,0 +1,174 @@
+""" Real-time chord recognition from a live stream of PCM blocks """
+import time
+from collections import deque, namedtuple
+
+import numpy as np
+
+from . import (_SAMPLE_RATE, _SEQ_LEN, _STEP_SIZE, _CHROMA_HOP, _CHROMA_BLOCK,
+               _MAJMIN_CLASSES)
+from .resampling import StreamResampler
+from .streaming import ChromaStream
+from .windowed import WindowedLabeler
+
+
+_RT_SEGMENT_FRAMES = 32 # chroma frames per NNLS-chroma run (~1.5 s)
+_RT_HOP = 32            # frames between model windows
+_RT_TIMING_HISTORY = 1000
+
+ChordEvent = namedtuple('ChordEvent', ['start', 'end', 'label'])
+BlockTiming = namedtuple('BlockTiming', ['num_samples', 'duration', 'process_time', 'rt_factor'])
+
+
+class RealtimeRecognizer():
+    """
+    Chord recognition on audio arriving as blocks of PCM samples (mono, float).
+
+    Each block goes through a streaming resampler, incremental NNLS chroma
+    (`ChromaStream`) and overlapping-window labeling (`WindowedLabeler`), all of
+    which keep their state between blocks. `process` returns the chords which
+    ended within the block as `ChordEvent(start, end, label)`, times in seconds.
+
+    Labels lag the input by at most `latency` seconds. Processing time of each
+    block is compared against its duration (the real-time budget), see
+    `timings`/`timing_summary`, and passed to `on_block` if given.
+    """
+
+    def __init__(self, sample_rate=_SAMPLE_RATE, rollon=1.0, hop=_RT_HOP,
+                 segment_frames=_RT_SEGMENT_FRAMES, backend='keras',
+                 resample_quality='default', on_block=None):
+        self.sample_rate = sample_rate
+        self.hop = hop
+        self.segment_frames = segment_frames
+        self.on_block = on_block
+        self.timings = deque(maxlen=_RT_TIMING_HISTORY)
+
+        self._resampler = StreamResampler(sample_rate, quality=resample_quality)
+        self._chroma_stream = ChromaStream(rollon=rollon, segment_frames=segment_frames)
+        self._labeler = WindowedLabeler(hop=hop, backend=backend)
+
+        self._chord_st = 0        # frame index where current chord started
+        self._chord_label = None  # current chord (numeric label)
+        self._num_labeled = 0
+
+    @property
+    def latency(self):
+        """ Upper bound (s) from audio arriving to its frame being labeled, excluding compute """
+        chroma_frames = self.segment_frames + _CHROMA_BLOCK/_CHROMA_HOP
+        window_frames = (_SEQ_LEN+self.hop)/2 + self.hop
+        return (chroma_frames + window_frames)*_STEP_SIZE
+
+    @property
+    def current_chord(self):
+        """ (start, label) of the chord still sounding at the last labeled frame """
+        if self._chord_label is None:
+            return None
+        return (self._chord_st*_STEP_SIZE, _MAJMIN_CLASSES[self._chord_label])
+
+    def _event(self, ed):
+        return ChordEvent(float(self._chord_st*_STEP_SIZE), float(ed*_STEP_SIZE),
+                          _MAJMIN_CLASSES[self._chord_label])
+
+    def _to_events(self, labels, final=False):
+        events = []
+        if len(labels) > 0:
+            labels = np.asarray(labels)
+            frame_ixs = self._num_labeled + np.arange(len(labels))
+            prev_labels = np.append([-1 if self._chord_label is None else self._chord_label],
+                                    labels[:-1])
+            for change_ix in frame_ixs[labels != prev_labels]:
+                if self._chord_label is not None:
+                    events.append(self._event(change_ix))
+                self._chord_st = change_ix
+                self._chord_label = labels[change_ix-self._num_labeled]
+
+            self._num_labeled += len(labels)
+
+        if final and (self._chord_label is not None):
+            events.append(self._event(self._num_labeled))
+            self._chord_label = None
+
+        return events
+
+    def _record(self, num_samples, process_time):
+        duration = num_samples/self.sample_rate
+        timing = BlockTiming(num_samples, duration, process_time,
+                             process_time/duration if duration > 0 else float('inf'))
+        self.timings.append(timing)
+        if self.on_block is not None:
+            self.on_block(timing)
+
+    def process(self, block):
+        """ Feed a block of samples, returns list of chords which ended """
+        st = time.perf_counter()
+        samples = self._resampler.process(np.asarray(block, dtype=np.float32))
+        labels = self._labeler.process(self._chroma_stream.process(samples))
+        events = self._to_events(labels)
+        self._record(len(block), time.perf_counter()-st)
+        return events
+
+    def flush(self):
+        """ End of stream: label remaining audio, returns remaining chords """
+        chroma = self._chroma_stream.process(self._resampler.flush())
+        labels = np.concatenate((self._labeler.process(chroma),
+                                 self._labeler.process(self._chroma_stream.flush()),
+                                 self._labeler.flush()))
+        return self._to_events(labels, final=True)
+
+    def timing_summary(self):
+        """ Real-time factor (processing time / audio duration) over recent blocks """
+        if not self.timings:
+            return {}
+
+        rt_factors = np.array([t.rt_factor for t in self.timings])
+        total_process = sum(t.process_time for t in self.timings)
+        total_duration = sum(t.duration for t in self.timings)
+        return {'blocks': len(rt_factors),
+                'rt_factor': total_process/total_duration,
+                'max_block_rt_factor': float(rt_factors.max()),
+                'overruns': int(np.sum(rt_factors > 1.0))} # blocks over budget
+
+
+def recognize_stream(blocks, sample_rate=_SAMPLE_RATE, **kwargs):
+    """
+    Chord recognition on an iterable of PCM blocks (e.g. a generator, or
+    `read_pcm_blocks` on a socket). Yields `ChordEvent`s as chords end.
+    Keyword arguments are passed to `RealtimeRecognizer`.
+    """
+    recognizer = RealtimeRecognizer(sample_rate=sample_rate, **kwargs)
+    for block in blocks:
+        yield from recognizer.process(block)
+    yield from recognizer.flush()
+
+def read_pcm_blocks(stream, block_size=4096, dtype=np.float32, channels=1):
+    """
+    Read raw interleaved PCM from a binary file-like object (e.g.
+    `socket.makefile('rb')`, `sys.stdin.buffer`) as mono float blocks.
+    Samples may be float, signed int, or unsigned int (e.g. 8-bit WAV, centered
+    on the midpoint) PCM.
+    """
+    dtype = np.dtype(dtype)
+    if dtype.kind not in 'fiu':
+        raise ValueError(f'autochord: Unsupported PCM dtype `{dtype}`, '
+                         f'use float, signed or unsigned int samples')
+
+    full_scale = 2**(8*dtype.itemsize - 1) # integer PCM amplitude of 1.0
+    frame_bytes = dtype.itemsize*channels
+    rest = b'' # bytes of an incomplete frame, completed by the next read
+    while True:
+        data = stream.read(block_size*frame_bytes)
+        if not data:
+            break
+
+        data = rest + data
+        num_frames = len(data)//frame_bytes
+        rest = data[num_frames*frame_bytes:]
+        if num_frames == 0:
+            continue
+
+        block = np.frombuffer(data[:num_frames*frame_bytes], dtype=dtype)
+        block = block.reshape(-1, channels).mean(axis=1, dtype=np.float32)
+        if dtype.kind == 'u': # center unsigned PCM on its midpoint
+            block -= full_scale
+        if dtype.kind in 'iu': # scale integer PCM to [-1, 1)
+            block /= full_scale
+        yield block
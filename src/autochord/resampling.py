@@ -0,0 +1,133 @@
+""" Resampling of audio to the operating sample rate """
+from fractions import Fraction
+
+import numpy as np
+
+from . import _SAMPLE_RATE
+
+
+# anti-aliasing filter per quality: (half-length per max(up, down), Kaiser beta);
+# 'default' is what scipy.signal.resample_poly uses
+_QUALITY_FILTERS = {
+    'fast': (4, 5.0),
+    'default': (10, 5.0),
+    'best': (32, 8.6),
+}
+_QUALITIES = [*_QUALITY_FILTERS, 'fft']
+_MAX_POLY_FACTOR = 1024 # above this, polyphase filters get too long; fall back to FFT
+
+
+def _poly_factors(fs_in, fs_out):
+    ratio = Fraction(int(fs_out), int(fs_in))
+    return ratio.numerator, ratio.denominator
+
+def _design_filter(up, down, quality):
+    from scipy.signal import firwin
+
+    half_len_factor, beta = _QUALITY_FILTERS[quality]
+    max_rate = max(up, down)
+    return firwin(2*half_len_factor*max_rate + 1, 1.0/max_rate, window=('kaiser', beta))
+
+def resample(samples, fs_in, fs_out=_SAMPLE_RATE, quality='default'):
+    """
+    Resample audio from `fs_in` to `fs_out`. Rational polyphase filtering is used
+    whenever the rate ratio reduces to small factors (e.g. 48k->44.1k is 147/160),
+    otherwise (or with `quality='fft'`) an FFT over the whole signal.
+
+    quality: 'fast', 'default', 'best' (polyphase filter length/stopband tradeoff),
+        or 'fft'
+    """
+    if quality not in _QUALITIES:
+        raise ValueError(f'autochord: Unknown resampling quality `{quality}`, '
+                         f'choose from {_QUALITIES}')
+
+    if fs_in == fs_out:
+        return samples
+
+    up, down = _poly_factors(fs_in, fs_out)
+    if (quality == 'fft') or (max(up, down) > _MAX_POLY_FACTOR):
+        from scipy.signal import resample as resample_fft
+        return resample_fft(samples, num=int(len(samples)*fs_out/fs_in))
+
+    from scipy.signal import resample_poly
+    return resample_poly(samples, up, down, window=_design_filter(up, down, quality))
+
+
+class StreamResampler():
+    """
+    Polyphase resampler for audio arriving in blocks. Each block is resampled
+    together with just enough neighbouring input for the anti-aliasing filter,
+    so the concatenated output matches `resample` over the whole signal while
+    memory stays bounded by the block size.
+
+    Rate ratios that do not reduce to factors up to `_MAX_POLY_FACTOR` (where
+    `resample` falls back to FFT over the whole signal) are not supported.
+    """
+
+    def __init__(self, fs_in, fs_out=_SAMPLE_RATE, quality='default'):
+        if quality not in _QUALITY_FILTERS:
+            raise ValueError(f'autochord: Unsupported streaming resampling quality `{quality}`, '
+                             f'choose from {list(_QUALITY_FILTERS)}')
+
+        self.up, self.down = _poly_factors(fs_in, fs_out)
+        if max(self.up, self.down) > _MAX_POLY_FACTOR:
+            raise ValueError(f'autochord: Cannot stream resample {fs_in} Hz to {fs_out} Hz '
+                             f'(ratio {self.up}/{self.down} exceeds polyphase factor '
+                             f'{_MAX_POLY_FACTOR}); use `resample` on the whole signal')
+
+        self._filter, self._ctx = None, 0
+        if self.up != self.down:
+            self._filter = _design_filter(self.up, self.down, quality)
+
+            # filter half-length in input samples; rounded up to a multiple
+            # of `down` so that context boundaries map to whole output samples
+            half_len = len(self._filter)//2
+            num_down = -(-(half_len//self.up + 2) // self.down)
+            self._ctx = num_down*self.down
+
+        self._buf = np.zeros(0, dtype=np.float32)
+        self._buf_st = 0  # input index of first buffered sample
+        self._emit_st = 0 # input index of first sample not yet resampled
+
+    def _resample(self, emit_ed, flush=False):
+        from scipy.signal import resample_poly
+
+        seg_st = self._emit_st - self._buf_st
+        seg_ed = len(self._buf) if flush else (emit_ed + self._ctx - self._buf_st)
+        out = resample_poly(self._buf[:seg_ed], self.up, self.down, window=self._filter)
+
+        skip = seg_st*self.up//self.down
+        if flush:
+            return out[skip:]
+
+        return out[skip:skip + (emit_ed - self._emit_st)*self.up//self.down]
+
+    def process(self, samples):
+        """ Feed a block of input samples, returns resampled output available so far """
+        if self.up == self.down:
+            return samples
+
+        self._buf = np.concatenate((self._buf, samples))
+        buf_ed = self._buf_st + len(self._buf)
+        emit_ed = ((buf_ed - self._ctx)//self.down)*self.down
+        if emit_ed <= self._emit_st:
+            return np.zeros(0, dtype=self._buf.dtype)
+
+        out = self._resample(emit_ed)
+        self._emit_st = emit_ed
+
+        # keep only left context for the next block
+        new_buf_st = max(0, self._emit_st - self._ctx)
+        self._buf = self._buf[new_buf_st - self._buf_st:]
+        self._buf_st = new_buf_st
+        return out
+
+    def flush(self):
+        """ Resample remaining input (end of signal) """
+        if (self.up == self.down) or (self._buf_st + len(self._buf) <= self._emit_st):
+            return np.zeros(0, dtype=self._buf.dtype)
+
+        out = self._resample(None, flush=True)
+        self._emit_st = self._buf_st + len(self._buf)
+        self._buf = self._buf[:0]
+        return out
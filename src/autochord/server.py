@@ -0,0 +1,254 @@
+"""
+Long-lived inference service which batches subsequences of concurrent
+requests together, with a local HTTP front end
+
+Run with: python -m autochord.server --port 8765
+"""
+import io
+import json
+import time
+import queue
+import argparse
+import threading
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.request import Request, urlopen
+
+import numpy as np
+
+from . import (_BATCH_SIZE, _CHROMA_NUM_FEATS, generate_chroma, _check_backend,
+               _to_subsequences, _predict_subsequences, _from_subsequences,
+               _to_chord_segments)
+
+
+_DEFAULT_HOST = '127.0.0.1'
+_DEFAULT_PORT = 8765
+_DEFAULT_MAX_LATENCY = 0.005 # seconds to wait for more requests to fill a batch
+
+
+class _Request():
+    def __init__(self, chroma_vectors):
+        self.num_frames = len(chroma_vectors)
+        self.chordseq_vectors = _to_subsequences(chroma_vectors)
+        self.future = Future()
+
+
+class InferenceServer():
+    """
+    Keeps one loaded model, and collects subsequences from concurrent
+    `predict` calls into batches of up to `batch_size` subsequences. A batch
+    is run once it is full or `max_latency` seconds after its first request
+    arrived; results are then split back to each caller.
+    """
+
+    def __init__(self, backend='keras', batch_size=_BATCH_SIZE, max_latency=_DEFAULT_MAX_LATENCY):
+        _check_backend(backend)
+        self.backend = backend
+        self.batch_size = batch_size
+        self.max_latency = max_latency
+        self.num_batches = 0
+        self.num_subseq = 0
+
+        self._queue = queue.Queue()
+        self._thread = None
+
+    def start(self):
+        """ Load model and start the batching thread """
+        if self._thread is not None:
+            return self
+
+        # pay model start-up before serving
+        dummy = np.zeros((1, _CHROMA_NUM_FEATS), dtype=np.float32)
+        _predict_subsequences(_to_subsequences(dummy), backend=self.backend)
+        self._thread = threading.Thread(target=self._run, name='autochord-batcher', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """ Finish queued requests, then stop the batching thread """
+        if self._thread is None:
+            return
+
+        self._queue.put(None)
+        self._thread.join()
+        self._thread = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def submit(self, chroma_vectors):
+        """ Queue chroma vectors for labeling, returns a Future of the labels """
+        if self._thread is None:
+            raise RuntimeError('autochord: InferenceServer is not started')
+
+        # reject malformed input here, so it cannot fail a whole batch
+        chroma_vectors = np.asarray(chroma_vectors)
+        if (chroma_vectors.ndim != 2) or (chroma_vectors.shape[1] != _CHROMA_NUM_FEATS):
+            raise ValueError(f'autochord: Chroma must have shape (num. frames, '
+                             f'{_CHROMA_NUM_FEATS}), got {chroma_vectors.shape}')
+
+        request = _Request(chroma_vectors)
+        self._queue.put(request)
+        return request.future
+
+    def predict(self, chroma_vectors, timeout=None):
+        """ Same as `autochord.predict_chord_labels`, but batched with other callers """
+        return self.submit(chroma_vectors).result(timeout=timeout)
+
+    @property
+    def stats(self):
+        return {'batches': self.num_batches, 'subsequences': self.num_subseq,
+                'avg_batch_fill': (self.num_subseq/(self.num_batches*self.batch_size)
+                                   if self.num_batches else 0.0)}
+
+    def _collect(self, first):
+        """ Collect requests until batch is full or latency window ends """
+        requests = [first]
+        num_subseq = len(first.chordseq_vectors)
+        deadline = time.monotonic() + self.max_latency
+        while num_subseq < self.batch_size:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                request = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                break
+            if request is None: # stop after this batch
+                self._queue.put(None)
+                break
+
+            requests.append(request)
+            num_subseq += len(request.chordseq_vectors)
+
+        return requests
+
+    def _process(self, requests):
+        # skip requests cancelled by their callers; the rest can no longer be cancelled
+        requests = [r for r in requests if r.future.set_running_or_notify_cancel()]
+        chordseq_vectors = [r.chordseq_vectors for r in requests if len(r.chordseq_vectors) > 0]
+        try:
+            pred_labels = np.zeros((0,), dtype=np.int32)
+            if chordseq_vectors:
+                pred_labels = _predict_subsequences(np.concatenate(chordseq_vectors),
+                                                    backend=self.backend)
+        except Exception as e:
+            for request in requests:
+                request.future.set_exception(e)
+            return
+
+        self.num_batches += -(-len(pred_labels) // self.batch_size)
+        self.num_subseq += len(pred_labels)
+
+        st = 0
+        for request in requests:
+            ed = st+len(request.chordseq_vectors)
+            request.future.set_result(_from_subsequences(pred_labels[st:ed], request.num_frames))
+            st = ed
+
+    def _run(self):
+        while True:
+            request = self._queue.get()
+            if request is None:
+                break
+
+            requests = self._collect(request)
+            try:
+                self._process(requests)
+            except Exception as e: # keep serving; fail only this batch's callers
+                for request in requests:
+                    if not request.future.done():
+                        request.future.set_exception(e)
+
+
+#----------
+# HTTP front end
+#----------
+class _Handler(BaseHTTPRequestHandler):
+    server_version = 'autochord'
+
+    def _reply(self, status, payload):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == '/stats':
+            self._reply(200, self.server.inference.stats)
+        else:
+            self._reply(404, {'error': f'unknown path {self.path}'})
+
+    def do_POST(self):
+        inference = self.server.inference
+        try:
+            body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+            if self.path == '/predict':   # body: chroma as .npy
+                chroma_vectors = np.load(io.BytesIO(body), allow_pickle=False)
+                labels = inference.predict(chroma_vectors)
+                self._reply(200, {'labels': labels.tolist()})
+            elif self.path == '/recognize': # body: {"audio_fn": <local path>}
+                params = json.loads(body)
+                chroma_vectors = generate_chroma(params['audio_fn'], rollon=params.get('rollon', 1.0))
+                labels = _to_chord_segments(inference.predict(chroma_vectors))
+                self._reply(200, {'labels': labels})
+            else:
+                self._reply(404, {'error': f'unknown path {self.path}'})
+        except ValueError as e: # malformed request
+            self._reply(400, {'error': f'{type(e).__name__}: {e}'})
+        except Exception as e:
+            self._reply(500, {'error': f'{type(e).__name__}: {e}'})
+
+    def log_message(self, format, *args): # pylint: disable=redefined-builtin
+        pass
+
+
+def serve(host=_DEFAULT_HOST, port=_DEFAULT_PORT, **server_kwargs):
+    """
+    Serve an `InferenceServer` over HTTP until interrupted. Endpoints:
+        POST /predict    chroma matrix as .npy -> {"labels": [...]}
+        POST /recognize  {"audio_fn": ...}     -> {"labels": [[start, end, chord], ...]}
+        GET  /stats
+    """
+    with InferenceServer(**server_kwargs) as inference:
+        httpd = ThreadingHTTPServer((host, port), _Handler)
+        httpd.daemon_threads = True
+        httpd.inference = inference
+        print(f'autochord: Serving on http://{host}:{port}')
+        try:
+            httpd.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            httpd.server_close()
+
+def predict_remote(chroma_vectors, url=f'http://{_DEFAULT_HOST}:{_DEFAULT_PORT}', timeout=None):
+    """ Client for POST /predict; returns numeric labels like `predict_chord_labels` """
+    buf = io.BytesIO()
+    np.save(buf, np.asarray(chroma_vectors, dtype=np.float32))
+    request = Request(f'{url}/predict', data=buf.getvalue(),
+                      headers={'Content-Type': 'application/octet-stream'})
+    with urlopen(request, timeout=timeout) as response:
+        return np.array(json.loads(response.read())['labels'], dtype=np.int32)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='autochord inference server')
+    parser.add_argument('--host', default=_DEFAULT_HOST)
+    parser.add_argument('--port', type=int, default=_DEFAULT_PORT)
+    parser.add_argument('--backend', default='keras')
+    parser.add_argument('--batch-size', type=int, default=_BATCH_SIZE)
+    parser.add_argument('--max-latency-ms', type=float, default=_DEFAULT_MAX_LATENCY*1000)
+    args = parser.parse_args()
+
+    serve(host=args.host, port=args.port, backend=args.backend,
+          batch_size=args.batch_size, max_latency=args.max_latency_ms/1000)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+""" Streaming chroma extraction with bounded memory """
+import numpy as np
+
+from . import (_SAMPLE_RATE, _CHROMA_HOP, _CHROMA_BLOCK, _CHROMA_NUM_FEATS,
+               _nnls_chroma)
+from .resampling import StreamResampler
+
+
+_SEGMENT_DURATION = 60.0 # seconds of audio per NNLS-chroma run
+_BLOCK_DURATION = 10.0   # seconds of audio decoded at a time
+
+
+class ChromaStream():
+    """
+    Incremental NNLS chroma over audio (at `_SAMPLE_RATE`) fed in blocks.
+
+    The VAMP plugin only emits chroma once it has seen all of its input, so
+    audio is cut into segments of `segment_frames` chroma frames and each
+    segment is run through the plugin separately, together with one analysis
+    block of look-ahead so that frames near the segment end see the same
+    samples as in a whole-signal run. Tuning is estimated per segment, so
+    outputs can differ slightly from `generate_chroma` on the whole file.
+    """
+
+    def __init__(self, rollon=1.0, segment_frames=int(_SEGMENT_DURATION*_SAMPLE_RATE/_CHROMA_HOP)):
+        self.rollon = rollon
+        self.segment_frames = segment_frames
+        self._buf = np.zeros(0, dtype=np.float32)
+
+    def _run_segment(self, samples, num_frames=None):
+        chroma = _nnls_chroma(samples, self.rollon)
+        return chroma if num_frames is None else chroma[:num_frames]
+
+    def process(self, samples):
+        """ Feed a block of samples, returns chroma frames completed so far """
+        self._buf = np.concatenate((self._buf, samples))
+        seg_len = self.segment_frames*_CHROMA_HOP
+
+        out = []
+        while len(self._buf) >= seg_len + _CHROMA_BLOCK:
+            out.append(self._run_segment(self._buf[:seg_len + _CHROMA_BLOCK],
+                                         num_frames=self.segment_frames))
+            self._buf = self._buf[seg_len:]
+
+        if not out:
+            return np.zeros((0, _CHROMA_NUM_FEATS), dtype=np.float32)
+
+        return np.concatenate(out)
+
+    def flush(self):
+        """ Chroma frames for remaining samples (end of audio) """
+        if len(self._buf) == 0:
+            return np.zeros((0, _CHROMA_NUM_FEATS), dtype=np.float32)
+
+        chroma = self._run_segment(self._buf)
+        self._buf = self._buf[:0]
+        return chroma
+
+
+def generate_chroma_stream(audio_fn, rollon=1.0, block_duration=_BLOCK_DURATION,
+                           segment_duration=_SEGMENT_DURATION, resample_quality='default'):
+    """
+    Generate chroma from raw audio like `generate_chroma`, but decode, resample
+    and extract incrementally. Yields arrays of consecutive chroma frames as
+    they become available, so memory stays bounded regardless of track length.
+
+    Decoding goes through `librosa.stream`, hence only formats supported by
+    soundfile can be streamed.
+    """
+    import librosa
+
+    fs = librosa.get_samplerate(audio_fn)
+    blocks = librosa.stream(audio_fn, block_length=int(block_duration*fs),
+                            frame_length=1, hop_length=1, mono=True,
+                            dtype=np.float32)
+
+    resampler = StreamResampler(fs, quality=resample_quality)
+    chroma_stream = ChromaStream(rollon=rollon,
+        segment_frames=int(segment_duration*_SAMPLE_RATE/_CHROMA_HOP))
+
+    for block in blocks:
+        chroma = chroma_stream.process(resampler.process(block))
+        if len(chroma) > 0:
+            yield chroma
+
+    chroma = chroma_stream.process(resampler.flush())
+    if len(chroma) > 0:
+        yield chroma
+
+    chroma = chroma_stream.flush()
+    if len(chroma) > 0:
+        yield chroma
@@ -0,0 +1,149 @@
+""" Overlapping-window inference and incremental (streaming) labeling """
+import numpy as np
+
+from . import (_SEQ_LEN, _CHROMA_NUM_FEATS, _check_backend, _to_subsequences,
+               _predict_subsequences, _predict_potentials, _from_subsequences)
+from .numpy_model import viterbi_decode
+
+
+_MERGES = ('crop', 'potentials')
+
+
+def _check_hop(hop):
+    if not 0 < hop <= _SEQ_LEN:
+        raise ValueError(f'autochord: hop must be within (0, {_SEQ_LEN}], got {hop}')
+
+def _window_starts(num_frames, hop):
+    """ Starts of windows `hop` apart, plus a final window flush with the end """
+    starts = np.arange(0, num_frames-_SEQ_LEN+1, hop)
+    if starts[-1]+_SEQ_LEN < num_frames:
+        starts = np.append(starts, num_frames-_SEQ_LEN)
+    return starts
+
+def _gather_windows(chroma_vectors, starts):
+    return chroma_vectors[starts[:, np.newaxis] + np.arange(_SEQ_LEN)]
+
+def _predict_short(chroma_vectors, backend):
+    """ Inputs shorter than one window are labeled as a single padded subsequence """
+    pred_labels = _predict_subsequences(_to_subsequences(chroma_vectors), backend=backend)
+    return _from_subsequences(pred_labels, len(chroma_vectors))
+
+
+class WindowedLabeler():
+    """
+    Incremental labeling with overlapping windows. Model windows of `_SEQ_LEN`
+    frames are run `hop` frames apart, and each frame takes the label from the
+    window in which it is most central, so labels near window edges (where the
+    BiLSTM lacks context) are replaced by labels from the neighbouring window.
+
+    Labels of a frame are final once the window owning it has been run, so they
+    can be emitted while chroma is still arriving: `process` returns labels
+    of frames finalized so far, `flush` the rest at end of input.
+    """
+
+    def __init__(self, hop=_SEQ_LEN//2, backend='keras'):
+        _check_hop(hop)
+        _check_backend(backend)
+        self.hop = hop
+        self.backend = backend
+        self.num_emitted = 0 # frames labeled so far
+
+        self._buf = np.zeros((0, _CHROMA_NUM_FEATS), dtype=np.float32)
+        self._buf_st = 0 # frame index of first buffered chroma vector
+        self._next_st = 0 # start frame of next window to run
+
+    @property
+    def _owned_len(self):
+        # a window owns frames up to the middle of its overlap with the next window
+        return (_SEQ_LEN+self.hop)//2
+
+    def process(self, chroma_vectors):
+        """ Feed chroma vectors, returns labels of frames finalized so far """
+        self._buf = np.concatenate((self._buf, chroma_vectors))
+        buf_ed = self._buf_st+len(self._buf)
+        if self._next_st+_SEQ_LEN > buf_ed:
+            return np.zeros(0, dtype=np.int32)
+
+        starts = np.arange(self._next_st, buf_ed-_SEQ_LEN+1, self.hop)
+        pred_labels = _predict_subsequences(_gather_windows(self._buf, starts-self._buf_st),
+                                            backend=self.backend)
+
+        # frames owned by each window: [previous cut, start + owned length)
+        cuts = starts+self._owned_len
+        frames = np.arange(self.num_emitted, cuts[-1])
+        owners = np.searchsorted(cuts, frames, side='right')
+        labels = pred_labels[owners, frames-starts[owners]]
+
+        self.num_emitted = cuts[-1]
+        self._next_st = starts[-1]+self.hop
+        # keep frames from the last window run, for the final window in `flush`
+        self._buf = self._buf[starts[-1]-self._buf_st:]
+        self._buf_st = starts[-1]
+        return labels
+
+    def flush(self):
+        """ Labels of remaining frames (end of input) """
+        buf_ed = self._buf_st+len(self._buf)
+        if buf_ed <= self.num_emitted:
+            return np.zeros(0, dtype=np.int32)
+
+        if buf_ed < _SEQ_LEN: # never had a full window
+            labels = _predict_short(self._buf, self.backend)
+        else: # final window flush with the end, owning everything not yet emitted
+            last_st = buf_ed-_SEQ_LEN
+            pred_labels = _predict_subsequences(
+                _gather_windows(self._buf, np.array([last_st-self._buf_st])),
+                backend=self.backend)
+            labels = pred_labels[0, self.num_emitted-last_st:]
+
+        self.num_emitted = buf_ed
+        self._buf = self._buf[:0]
+        self._buf_st = buf_ed
+        return labels
+
+
+def _merge_potentials(chroma_vectors, hop, backend):
+    """
+    Average CRF potentials of overlapping windows, weighting each position by
+    its distance from the window edge, then Viterbi-decode the whole sequence
+    """
+    num_frames = len(chroma_vectors)
+    starts = _window_starts(num_frames, hop)
+    potentials, transitions = _predict_potentials(_gather_windows(chroma_vectors, starts),
+                                                  backend=backend)
+
+    pos = np.arange(_SEQ_LEN)
+    weights = np.minimum(pos+1, _SEQ_LEN-pos).astype(potentials.dtype)
+    frame_ixs = (starts[:, np.newaxis] + pos).ravel()
+
+    merged = np.zeros((num_frames, potentials.shape[-1]), dtype=potentials.dtype)
+    np.add.at(merged, frame_ixs, (potentials*weights[np.newaxis, :, np.newaxis])
+              .reshape(-1, potentials.shape[-1]))
+    weight_sums = np.bincount(frame_ixs, weights=np.tile(weights, len(starts)),
+                              minlength=num_frames)
+    merged /= weight_sums[:, np.newaxis]
+
+    return viterbi_decode(merged[np.newaxis], transitions)[0]
+
+def predict_chord_labels_windowed(chroma_vectors, hop=_SEQ_LEN//2, merge='crop', backend='keras'):
+    """
+    Predict (numeric) chord labels using overlapping windows `hop` frames apart
+
+    merge: 'crop' takes each frame's label from the window where it is most
+        central (same labels as `WindowedLabeler`), 'potentials' averages the
+        CRF potentials of overlapping windows and decodes the whole song at once
+    """
+    _check_hop(hop)
+    _check_backend(backend)
+    if merge not in _MERGES:
+        raise ValueError(f'autochord: Unknown merge `{merge}`, choose from {_MERGES}')
+
+    chroma_vectors = np.asarray(chroma_vectors)
+    if len(chroma_vectors) <= _SEQ_LEN:
+        return _predict_short(chroma_vectors, backend)
+
+    if merge == 'potentials':
+        return _merge_potentials(chroma_vectors, hop, backend)
+
+    labeler = WindowedLabeler(hop=hop, backend=backend)
+    return np.concatenate((labeler.process(chroma_vectors), labeler.flush()))